@@ -0,0 +1,380 @@
+"""This module loads the size-to-frequency JSON files written by the drivers, merges them by
+distribution configuration and fits a discrete power law to the cascade sizes of every group.
+
+It can be run on the command-line with 'python analysis.py <directory>' to print a summary table."""
+
+import argparse
+import csv
+import glob
+import os
+import sys
+
+import numpy as np
+from scipy.optimize import brentq
+from scipy.special import zeta
+
+from distributions import parse_result_name
+from results_store import ResultsStore, load_histogram
+
+SUMMARY_COLUMNS = ['network', 'cash', 'leverage', 'precision', 'runs', 'steps', 'xmin', 'tail_events', 'max_size',
+                   'alpha', 'stderr', 'ci_low', 'ci_high']
+
+# Exponents tabulated for the maximum-likelihood fit. Estimates outside the table are solved
+# for individually up to ALPHA_MAX, beyond which the fit gives nan.
+ALPHA_GRID = np.arange(1.001, 8.0, 0.001)
+ALPHA_MAX = 50.0
+
+
+def merge_histograms(histograms):
+    """Sums histograms of different lengths.
+
+    Args:
+        histograms (iterable of numpy arrays): Histograms to merge.
+
+    Returns:
+        A single histogram long enough to hold the largest cascade size.
+    """
+    merged = np.zeros(0, dtype=np.int64)
+    for counts in histograms:
+        if len(counts) > len(merged):
+            merged = np.pad(merged, (0, len(counts) - len(merged)), 'constant')
+        merged[:len(counts)] += counts
+    return merged
+
+
+def load_results(directory, pattern='*result_*.json'):
+    """Streams every result file in a directory and merges them by configuration.
+
+    Only one file is held in memory at a time.
+
+    Args:
+        directory (str): Directory holding the result files.
+        pattern (str): Glob pattern of the result files.
+
+    Returns:
+        A dict from (network, cash_label, leverage_label, precision) to a (histogram, runs)
+        tuple. Result files are always float64 runs.
+    """
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        key = parse_result_name(path)
+        if key is None:
+            continue
+        key += ('float64',)
+        counts = load_histogram(path)
+        if key in groups:
+            merged, runs = groups[key]
+            groups[key] = (merge_histograms([merged, counts]), runs + 1)
+        else:
+            groups[key] = (counts, 1)
+    return groups
+
+
+def load_store_results(store, **query):
+    """Merges the size-to-frequency runs of a ResultsStore by configuration and precision policy.
+
+    Args:
+        store (ResultsStore): Store to read from.
+        **query: Extra filters passed on to ResultsStore.load_all.
+
+    Returns:
+        A dict in the same format as load_results.
+    """
+    groups = {}
+    for meta, counts in store.load_all(kind='frequency', **query):
+        key = (meta['network'], meta['cash_label'], meta['leverage_label'], meta['precision'])
+        counts = counts.astype(np.int64)
+        if key in groups:
+            merged, runs = groups[key]
+            groups[key] = (merge_histograms([merged, counts]), runs + 1)
+        else:
+            groups[key] = (counts, 1)
+    return groups
+
+
+def stack_histograms(histograms):
+    """Stacks histograms of different lengths into one zero-padded 2D array."""
+    width = max(len(counts) for counts in histograms)
+    stacked = np.zeros((len(histograms), width), dtype=np.int64)
+    for row, counts in enumerate(histograms):
+        stacked[row, :len(counts)] = counts
+    return stacked
+
+
+def _zeta_table(xmin):
+    """Derivatives of ln zeta(alpha, xmin) over ALPHA_GRID.
+
+    Returns:
+        A (first, second) tuple of arrays. -first is the mean of ln x under the power law
+        with exponent alpha, second is the Fisher information of alpha per event.
+    """
+    log_zeta = np.log(zeta(ALPHA_GRID, xmin))
+    first = np.gradient(log_zeta, ALPHA_GRID)
+    return first, np.gradient(first, ALPHA_GRID)
+
+
+def _log_zeta_excess(alpha, xmin):
+    """ln zeta(alpha, xmin) + alpha ln xmin, computed so it stays accurate for large alpha."""
+    return np.log1p(np.exp(alpha * np.log(xmin) + np.log(zeta(alpha, xmin + 1))))
+
+
+def _solve_alpha(mean_log, xmin, h=1e-5):
+    """Solves for the exponent whose mean of ln x equals `mean_log`, outside ALPHA_GRID.
+
+    Returns:
+        An (alpha, information) tuple, both nan if the solution is not in (1, ALPHA_MAX].
+    """
+    # Mean of ln(x / xmin) under the model, which decreases with alpha
+    def excess(alpha):
+        return (_log_zeta_excess(alpha - h, xmin) - _log_zeta_excess(alpha + h, xmin)) / (2 * h)
+
+    target = mean_log - np.log(xmin)
+    lo, hi = (ALPHA_GRID[-1], ALPHA_MAX) if excess(ALPHA_GRID[-1]) > target else (1 + 2 * h, ALPHA_GRID[0])
+    if not excess(lo) >= target >= excess(hi):
+        return np.nan, np.nan
+    alpha = brentq(lambda a: excess(a) - target, lo, hi, xtol=1e-10)
+    step = 1e-3
+    information = (_log_zeta_excess(alpha + step, xmin) - 2 * _log_zeta_excess(alpha, xmin) +
+                   _log_zeta_excess(alpha - step, xmin)) / step ** 2
+    return alpha, information
+
+
+def fit_tail(n, log_sum, xmin):
+    """Exact maximum-likelihood exponent of a discrete power law from its sufficient statistics.
+
+    The log-likelihood of n tail events x >= xmin is -n ln zeta(alpha, xmin) - alpha sum(ln x),
+    so the estimate only depends on n and sum(ln x). It is found by matching the mean of ln x to
+    its expectation under the model (Clauset, Shalizi and Newman, 2009, eq. 3.5), which stays
+    exact for small xmin where the continuous approximation is biased. Estimates inside
+    ALPHA_GRID are interpolated from a table, the others are solved for with brentq.
+
+    Args:
+        n (numpy array): Number of tail events per fit.
+        log_sum (numpy array): Sum of ln x over the tail events per fit.
+        xmin (numpy array or int): Smallest cascade size included in each fit, at least 1.
+
+    Returns:
+        A (alpha, stderr) tuple of arrays. Fits without tail events, or whose exponent is not
+        in (1, ALPHA_MAX], have an alpha of nan.
+
+    Raises:
+        ValueError: If an xmin is smaller than 1.
+    """
+    n = np.asarray(n, dtype=float)
+    log_sum = np.asarray(log_sum, dtype=float)
+    xmin = np.broadcast_to(np.asarray(xmin), n.shape)
+    if np.any(xmin < 1):
+        raise ValueError('xmin must be at least 1')
+    alpha = np.full(n.shape, np.nan)
+    stderr = np.full(n.shape, np.nan)
+    for value in np.unique(xmin):
+        rows = (xmin == value) & (n > 0)
+        if not rows.any():
+            continue
+        first, second = _zeta_table(value)
+        mean_log = log_sum[rows] / n[rows]
+        # -first decreases with alpha, np.interp needs increasing x values
+        fitted = np.interp(mean_log, -first[::-1], ALPHA_GRID[::-1])
+        information = np.interp(fitted, ALPHA_GRID, second)
+        # np.interp clamps to the ends of the table, solve those fits exactly instead
+        outside = (mean_log > -first[0]) | (mean_log < -first[-1])
+        for k in np.nonzero(outside)[0]:
+            fitted[k], information[k] = _solve_alpha(mean_log[k], value)
+        alpha[rows] = fitted
+        stderr[rows] = 1 / np.sqrt(n[rows] * information)
+    return alpha, stderr
+
+
+def tail_statistics(counts, xmin):
+    """Number of tail events and sum of ln x over them for every histogram.
+
+    Args:
+        counts (numpy ndarray): 2D array with one histogram per row.
+        xmin (numpy array or int): Smallest cascade size in the tail, per row or for all rows.
+
+    Returns:
+        A (n, log_sum) tuple of arrays with one entry per row.
+    """
+    sizes = np.arange(counts.shape[1])
+    xmin = np.broadcast_to(np.asarray(xmin), (counts.shape[0],))
+    tail = np.where(sizes >= xmin[:, None], counts, 0)
+    return tail.sum(axis=1), tail.dot(np.log(np.maximum(sizes, 1)))
+
+
+def fit_power_law(counts, xmin=1):
+    """Maximum-likelihood exponent of a discrete power law for many histograms at once.
+
+    Args:
+        counts (numpy ndarray): 2D array with one histogram per row.
+        xmin (numpy array or int): Smallest cascade size included in the fit, per row or for
+            all rows.
+
+    Returns:
+        A (alpha, stderr, n) tuple of arrays with one entry per row. Rows without tail
+        events have an alpha of nan.
+    """
+    n, log_sum = tail_statistics(counts, xmin)
+    alpha, stderr = fit_tail(n, log_sum, xmin)
+    return alpha, stderr, n
+
+
+def select_xmin(counts, min_tail=50):
+    """Picks the xmin of every histogram that minimizes the Kolmogorov-Smirnov distance between
+    its tail and the fitted power law (Clauset, Shalizi and Newman, 2009).
+
+    Args:
+        counts (numpy ndarray): 2D array with one histogram per row.
+        min_tail (int): Smallest number of tail events an xmin may leave for the fit.
+
+    Returns:
+        An array with the xmin of every row, 1 for rows with too few events to choose.
+    """
+    rows, width = counts.shape
+    best = np.ones(rows, dtype=np.int64)
+    best_ks = np.full(rows, np.inf)
+    for xmin in range(1, width):
+        tail = counts[:, xmin:]
+        n = tail.sum(axis=1)
+        usable = n >= min_tail
+        if not usable.any():
+            break
+        alpha, _, _ = fit_power_law(counts[usable], xmin)
+        sizes = np.arange(xmin, width)
+        model = 1 - zeta(alpha[:, None], sizes + 1) / zeta(alpha[:, None], xmin)
+        empirical = np.cumsum(tail[usable], axis=1) / n[usable, None].astype(float)
+        ks = np.abs(empirical - model).max(axis=1)
+        better = np.zeros(rows, dtype=bool)
+        better[usable] = ks < best_ks[usable]
+        best[better] = xmin
+        best_ks[better] = ks[better[usable]]
+    return best
+
+
+def bootstrap_power_law(counts, xmin=1, samples=1000, confidence=0.95):
+    """Bootstrap confidence intervals of the power law exponent for many histograms.
+
+    Each histogram's tail is resampled with a multinomial draw. Only the sufficient statistics
+    of every resample are kept, so memory grows with groups x samples rather than with the
+    histograms, and all resamples are fit in a single vectorized call.
+
+    Args:
+        counts (numpy ndarray): 2D array with one histogram per row.
+        xmin (numpy array or int): Smallest cascade size included in the fit, per row or for
+            all rows.
+        samples (int): Number of bootstrap resamples per histogram.
+        confidence (float): Width of the confidence interval.
+
+    Returns:
+        A (low, high) tuple of arrays with one entry per row.
+    """
+    xmin = np.broadcast_to(np.asarray(xmin), (counts.shape[0],))
+    log_sizes = np.log(np.maximum(np.arange(counts.shape[1]), 1))
+    n = np.zeros((counts.shape[0], samples))
+    log_sum = np.zeros((counts.shape[0], samples))
+    for row, hist in enumerate(counts):
+        tail = hist[xmin[row]:]
+        total = tail.sum()
+        if total == 0:
+            continue
+        n[row] = total
+        log_sum[row] = np.random.multinomial(total, tail / float(total), size=samples).dot(log_sizes[xmin[row]:])
+    alpha, _ = fit_tail(n.ravel(), log_sum.ravel(), np.repeat(xmin, samples))
+    alpha = alpha.reshape(counts.shape[0], samples)
+    low = np.full(counts.shape[0], np.nan)
+    high = np.full(counts.shape[0], np.nan)
+    fitted = ~np.isnan(alpha).any(axis=1)
+    tails = 100 * (1 - confidence) / 2
+    if fitted.any():
+        low[fitted], high[fitted] = np.percentile(alpha[fitted], [tails, 100 - tails], axis=1)
+    return low, high
+
+
+def summarize(groups, xmin=1, samples=1000, confidence=0.95):
+    """Fits every group and builds the summary table.
+
+    Args:
+        groups (dict): Output of load_results.
+        xmin (int or str): Smallest cascade size included in the fit, or 'auto' to choose it
+            per group with select_xmin.
+        samples (int): Number of bootstrap resamples per group.
+        confidence (float): Width of the confidence interval.
+
+    Returns:
+        A list of dicts, one per group, with the keys in SUMMARY_COLUMNS.
+    """
+    keys = sorted(groups)
+    if not keys:
+        return []
+    counts = stack_histograms([groups[key][0] for key in keys])
+    if xmin == 'auto':
+        xmins = select_xmin(counts)
+    else:
+        xmins = np.full(len(keys), xmin, dtype=np.int64)
+    if counts.shape[1] <= xmins.max():
+        counts = np.pad(counts, ((0, 0), (0, xmins.max() + 1 - counts.shape[1])), 'constant')
+    alpha, stderr, n = fit_power_law(counts, xmins)
+    low, high = bootstrap_power_law(counts, xmins, samples, confidence)
+
+    rows = []
+    for row, (network, cash, leverage, precision) in enumerate(keys):
+        nonzero = np.nonzero(counts[row])[0]
+        rows.append({
+            'network': network,
+            'cash': cash,
+            'leverage': leverage,
+            'precision': precision,
+            'runs': groups[keys[row]][1],
+            'steps': int(counts[row].sum()),
+            'xmin': int(xmins[row]),
+            'tail_events': int(n[row]),
+            'max_size': int(nonzero[-1]) if len(nonzero) else 0,
+            'alpha': alpha[row],
+            'stderr': stderr[row],
+            'ci_low': low[row],
+            'ci_high': high[row],
+        })
+    return rows
+
+
+def write_summary(rows, fp):
+    """Writes the summary table as CSV to an open file."""
+    writer = csv.DictWriter(fp, fieldnames=SUMMARY_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def _xmin_arg(value):
+    if value == 'auto':
+        return value
+    if int(value) < 1:
+        raise argparse.ArgumentTypeError('xmin must be at least 1')
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit power laws to size-to-frequency result files.')
+    parser.add_argument('directory', nargs='?', default='.', help='directory holding the result files')
+    parser.add_argument('--store', help='read the runs from this results store instead of JSON files')
+    parser.add_argument('--pattern', default='*result_*.json', help='glob pattern of the result files')
+    parser.add_argument('--xmin', type=_xmin_arg, default=1,
+                        help="smallest cascade size included in the fit, or 'auto' to choose it per group")
+    parser.add_argument('--bootstrap', type=int, default=1000, help='bootstrap resamples per group')
+    parser.add_argument('--confidence', type=float, default=0.95, help='width of the confidence interval')
+    parser.add_argument('--output', help='write the summary CSV here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.store:
+        with ResultsStore(args.store) as store:
+            groups = load_store_results(store)
+    else:
+        groups = load_results(args.directory, args.pattern)
+    rows = summarize(groups, args.xmin, args.bootstrap, args.confidence)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            write_summary(rows, fp)
+    else:
+        write_summary(rows, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
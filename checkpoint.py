@@ -0,0 +1,93 @@
+"""Periodic checkpoints of a running simulation so that long runs can be resumed.
+
+A checkpoint is a single .npz file holding the arrays and scalars passed to Checkpointer.save
+together with the state of numpy's global random number generator. Restoring both and
+continuing from the saved step gives the same results as an uninterrupted run."""
+
+import os
+
+import numpy as np
+
+
+def get_rng_state():
+    """Returns numpy's global RNG state as a dict of arrays that np.savez can store."""
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {'rng_keys': keys, 'rng_pos': pos, 'rng_has_gauss': has_gauss, 'rng_cached_gaussian': cached_gaussian}
+
+
+def set_rng_state(state):
+    """Restores numpy's global RNG from the dict built by get_rng_state."""
+    np.random.set_state(('MT19937', np.asarray(state['rng_keys'], dtype=np.uint32), int(state['rng_pos']),
+                         int(state['rng_has_gauss']), float(state['rng_cached_gaussian'])))
+
+
+def save_checkpoint(path, state):
+    """Atomically writes a checkpoint.
+
+    The file is written next to the destination and renamed over it, so a crash while saving
+    leaves the previous checkpoint intact.
+
+    Args:
+        path (str): Checkpoint file.
+        state (dict): Arrays and scalars to save.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        np.savez(fp, **state)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint.
+
+    Args:
+        path (str): Checkpoint file.
+
+    Returns:
+        A dict of the saved values with scalars converted back to Python types, or None if
+        there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key].item() if data[key].ndim == 0 else data[key] for key in data.files}
+
+
+class Checkpointer:
+    """Saves the state of a run every `interval` steps.
+
+    Args:
+        path (str): Checkpoint file.
+        interval (int): Number of steps between checkpoints. None or 0 disables checkpointing.
+    """
+
+    def __init__(self, path, interval=50000):
+        self.path = path
+        self.interval = interval
+
+    def due(self, step):
+        """Returns True if a checkpoint should be written after `step` steps."""
+        return bool(self.interval) and step % self.interval == 0
+
+    def save(self, **state):
+        """Writes the given state plus the global RNG state."""
+        if not self.interval:
+            return
+        state.update(get_rng_state())
+        save_checkpoint(self.path, state)
+
+    def load(self):
+        """Returns the saved state, or None if there is no checkpoint."""
+        if not self.interval:
+            return None
+        return load_checkpoint(self.path)
+
+    def restore_rng(self, state):
+        """Restores the global RNG from a state returned by load."""
+        set_rng_state(state)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,10 +1,29 @@
-import cvxpy as cvx
+"""Contagion models of financial networks and the helpers that generate them.
+
+The simulation classes only need NumPy. cvxpy (used by make_connections) and matplotlib (used
+by the show methods) are imported on first use, so processes that only run simulations never
+pay their import time and memory."""
+
 # import networkx as nx
-# import matplotlib.pyplot as plt
 import numpy as np
 from random import shuffle
 
 
+def scale_amount(amount, proportion):
+    """Returns proportion * amount, truncated to whole units for integer (fixed-point) matrices.
+
+    Args:
+        amount (numpy scalar): Entry of a liabilities matrix.
+        proportion (float): Fraction of the amount.
+
+    Returns:
+        The scaled amount, of the same type as `amount` for integer matrices.
+    """
+    if isinstance(amount, np.integer):
+        return type(amount)(int(proportion * amount))
+    return proportion * amount
+
+
 def binarize_probabilities(mat):
     """Turns a matrix of probabilities into a binary matrix.
 
@@ -64,6 +83,8 @@ def make_connections(connectivity_vector):
     Returns:
         A probability matrix where each i,j entry is the probability that i and j are connected.
     """
+    import cvxpy as cvx
+
     size = connectivity_vector.shape[0]
     connections = cvx.Variable(size, size)
     objective = cvx.Minimize(cvx.sum_entries(connections))
@@ -123,7 +144,7 @@ class DeterministicRatioNetwork:
     def recover(self, i):
         for j in range(self.size):
             if i != j:
-                self.liabilities[j, j] += self.recovery_rate * self.liabilities[j, i]
+                self.liabilities[j, j] += scale_amount(self.liabilities[j, i], self.recovery_rate)
                 self.liabilities[j, i] = 0
 
     def step(self):
@@ -141,8 +162,8 @@ class DeterministicRatioNetwork:
         # but by up to 10% of capital?
         # Should we subtract from capital when we're issuing another loan?
         if capital != 0:
-            self.liabilities[rand_i, rand_j] += rand_prop * self.liabilities[rand_i, rand_i]
-            self.liabilities[rand_i, rand_i] -= rand_prop * self.liabilities[rand_i, rand_i]
+            self.liabilities[rand_i, rand_j] += scale_amount(self.liabilities[rand_i, rand_i], rand_prop)
+            self.liabilities[rand_i, rand_i] -= scale_amount(self.liabilities[rand_i, rand_i], rand_prop)
         else:
             if rand_i == rand_j:
                 self.liabilities[rand_i, rand_j] = self.initial_cap
@@ -181,6 +202,8 @@ class DeterministicRatioNetwork:
         return ratios, num_defaults
 
     def show(self):
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
         ax = fig.add_subplot(1,1,1)
         ax.set_aspect('equal')
@@ -191,11 +214,13 @@ class DeterministicRatioNetwork:
         
 class TestNetwork:
     
-    def __init__(self, size, liabilities=None, recovery_rate=0.0, initial_cap=10000):
+    def __init__(self, size, liabilities=None, recovery_rate=0.0, initial_cap=10000, event_log=None):
         self.size = size
         self.liabilities = liabilities if liabilities is not None else np.zeros((size, size))
         self.recovery_rate = recovery_rate
         self.initial_cap = initial_cap
+        # Optional sink (see event_log.py) that receives the defaulted banks of every step
+        self.event_log = event_log
 
     def reset_net(self):
         for i in range(self.size):
@@ -209,7 +234,7 @@ class TestNetwork:
     def recover(self, i):
         for j in range(self.size):
             if i != j:
-                self.liabilities[j, j] += self.recovery_rate * self.liabilities[j, i]
+                self.liabilities[j, j] += scale_amount(self.liabilities[j, i], self.recovery_rate)
                 self.liabilities[j, i] = 0
 
     def step(self):
@@ -224,8 +249,8 @@ class TestNetwork:
         liabilities = self.liabilities[:, rand_i].sum() - capital
 
         if capital != 0:
-            self.liabilities[rand_i, rand_j] += rand_prop * self.liabilities[rand_i, rand_i]
-            self.liabilities[rand_i, rand_i] -= rand_prop * self.liabilities[rand_i, rand_i]
+            self.liabilities[rand_i, rand_j] += scale_amount(self.liabilities[rand_i, rand_i], rand_prop)
+            self.liabilities[rand_i, rand_i] -= scale_amount(self.liabilities[rand_i, rand_i], rand_prop)
         else:
             if rand_i == rand_j:
                 self.liabilities[rand_i, rand_j] = self.initial_cap
@@ -259,7 +284,9 @@ class TestNetwork:
         results['ratio_defaults'] = num_defaults
         previous_default = 0
         num_defaults = 0
+        rounds = [list(defaulted_banks)] if self.event_log is not None else None
         while True:  # Cascade until no more defaults
+            round_start = len(defaulted_banks)
             for i in range(self.size):
                 if i in defaulted_banks: continue
                 capital = self.liabilities[i, i]
@@ -270,16 +297,22 @@ class TestNetwork:
                         defaulted_banks.append(i)
                         num_defaults += 1
                         break
+            if rounds is not None and len(defaulted_banks) > round_start:
+                rounds.append(defaulted_banks[round_start:])
             if previous_defaults == num_defaults:
                 break
             previous_defaults = num_defaults
         for default in defaulted_banks:
             self.liabilities[:, default] = 0
             self.liabilities[default, :] = 0
+        if self.event_log is not None:
+            self.event_log.record(rand_i, rand_j, rounds)
         results['cascade_defaults'] = num_defaults
         return results
 
     def show(self):
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
         ax = fig.add_subplot(1,1,1)
         ax.set_aspect('equal')
@@ -307,7 +340,7 @@ class DeterministicNetwork:
     def recover(self, i):
         for j in range(self.size):
             if i != j:
-                self.liabilities[j, j] += self.recovery_rate * self.liabilities[j, i]
+                self.liabilities[j, j] += scale_amount(self.liabilities[j, i], self.recovery_rate)
                 self.liabilities[j, i] = 0
 
     def step(self):
@@ -322,6 +355,8 @@ class DeterministicNetwork:
                 self.recover(i)
 
     def show(self):
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
         ax = fig.add_subplot(1,1,1)
         ax.set_aspect('equal')
@@ -0,0 +1,141 @@
+"""Cash and leverage distributions used to generate networks.
+
+A distribution is described by a dict such as
+
+    {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}}
+
+The sampler arguments of each family are listed in FAMILIES. For families whose sampler has no
+'Scale' argument, a 'Scale' parameter multiplies the samples instead, as setCashScale and
+setLeverageScale did in size_to_frequencyDistros.py.
+
+label builds the string recording a distribution in result names and the results store, and
+parse_label and parse_result_name read it back."""
+
+import os
+import re
+
+import numpy as np
+
+# family -> (label prefix, sampler argument names, sampler)
+FAMILIES = {
+    'beta': ('Beta', ('Alpha', 'Beta'), lambda a, b, size: np.random.beta(a, b, size)),
+    'chisquare': ('Chisquare', ('Df',), lambda df, size: np.random.chisquare(df, size)),
+    'f': ('f', ('Dfnum', 'Dfden'), lambda dfnum, dfden, size: np.random.f(dfnum, dfden, size)),
+    'gamma': ('Gamma', ('Shape', 'Scale'), lambda shape, scale, size: np.random.gamma(shape, scale, size)),
+    'lognormal': ('Lognormal', ('Mean', 'Sigma'), lambda mean, sigma, size: np.random.lognormal(mean, sigma, size)),
+    'normal': ('Normal', ('location', 'Scale'), lambda loc, scale, size: np.random.normal(loc, scale, size)),
+    'poisson': ('Poisson', ('Lambda',), lambda lam, size: np.random.poisson(lam, size)),
+}
+
+# family -> order of the parameters in labels, as written by generateCashString and generateLeverageString
+LABEL_ORDER = {
+    'beta': ('Alpha', 'Beta', 'Scale'),
+    'chisquare': ('Df', 'Scale'),
+    'f': ('Dfnum', 'Dfden', 'Scale'),
+    'gamma': ('Shape', 'Scale'),
+    'lognormal': ('Mean', 'Scale', 'Sigma'),
+    'normal': ('location', 'Scale'),
+    'poisson': ('Lambda', 'Scale'),
+}
+
+ROLES = {'cash': 'Cash', 'leverage': 'Leverage'}
+
+# File names look like
+#   TestNetworkresult_BetaCash_Alpha2Beta8Scale40000_BetaLeverage_Alpha2Beta8Scale40_19_10_17_120000.json
+# where the cash and leverage labels come from generateCashString/generateLeverageString.
+# Older files such as result_1.json carry no configuration and are grouped on their own.
+RESULT_NAME = re.compile(r'^(?P<network>[A-Za-z]*)result_'
+                         r'(?P<cash>[A-Za-z]+Cash_[^_]*_)?'
+                         r'(?P<leverage>[A-Za-z]+Leverage_[^_]*_)?'
+                         r'(?P<stamp>.*)\.json$')
+LABEL = re.compile(r'^(?P<family>[A-Za-z]+?)(?P<role>Cash|Leverage)_(?P<params>[^_]*)_$')
+PARAM = re.compile(r'([A-Za-z]+)(-?(?:\d+\.?\d*|\.\d+)(?:e[+-]\d+)?)')
+
+
+def sample(distribution, size, role):
+    """Draws a cash vector or leverage ratios from numpy's global RNG.
+
+    Args:
+        distribution (dict): Distribution with 'family' and 'params' keys.
+        size (int): Number of samples.
+        role (str): 'cash' or 'leverage'.
+
+    Returns:
+        A numpy array of samples.
+    """
+    family, params = distribution['family'], distribution['params']
+    if family not in FAMILIES:
+        raise ValueError('unknown distribution: ' + str(family))
+    prefix, arg_names, sampler = FAMILIES[family]
+    missing = [name for name in arg_names if name not in params]
+    if missing:
+        raise ValueError('{0} distribution is missing parameters {1}'.format(family, missing))
+
+    if family == 'f' and role == 'cash':
+        # The drivers have always drawn f cash vectors from a gamma distribution,
+        # keep doing so the results stay comparable with earlier runs.
+        samples = np.random.gamma(params['Dfnum'], params['Dfden'], size)
+    else:
+        samples = sampler(*([params[name] for name in arg_names] + [size]))
+    if 'Scale' in params and 'Scale' not in arg_names:
+        samples = samples * params['Scale']
+    return samples
+
+
+def label(distribution, role):
+    """Builds the label recording a distribution, e.g. 'BetaCash_Alpha2Beta8Scale40000_'.
+
+    The parameters appear in the order of LABEL_ORDER whatever the order of the params dict,
+    so one configuration always gets the label generateCashString and generateLeverageString
+    gave it. Parameters not listed there follow in alphabetical order.
+
+    Args:
+        distribution (dict): Distribution with 'family' and 'params' keys.
+        role (str): 'cash' or 'leverage'.
+
+    Returns:
+        The label string.
+    """
+    family, params = distribution['family'], distribution['params']
+    order = LABEL_ORDER[family]
+    names = [name for name in order if name in params] + sorted(name for name in params if name not in order)
+    prefix = FAMILIES[family][0]
+    params = ''.join(name + str(params[name]) for name in names)
+    return prefix + ROLES[role] + '_' + params + '_'
+
+
+def parse_result_name(path):
+    """Splits a result file name into the configuration encoded in it.
+
+    Args:
+        path (str): Path to a result file.
+
+    Returns:
+        A (network, cash_label, leverage_label) tuple, or None if the name is not a result file.
+        The labels are empty strings for files written without a distribution configuration.
+    """
+    match = RESULT_NAME.match(os.path.basename(path))
+    if match is None:
+        return None
+    return match.group('network'), match.group('cash') or '', match.group('leverage') or ''
+
+
+def parse_label(label):
+    """Turns a cash or leverage label back into its distribution and parameters.
+
+    Args:
+        label (str): Label such as 'BetaCash_Alpha2Beta8Scale40000_'.
+
+    Returns:
+        A (family, params) tuple where family is the lower-case distribution name used by the
+        drivers and params is a dict of parameter name to value. Returns (None, {}) for
+        labels that cannot be parsed.
+    """
+    match = LABEL.match(label)
+    if match is None:
+        return None, {}
+    params = {}
+    for name, value in PARAM.findall(match.group('params')):
+        number = float(value)
+        params[name] = int(number) if number.is_integer() and '.' not in value else number
+    return match.group('family').lower(), params
@@ -0,0 +1,188 @@
+"""A compact, append-only log of the defaults of every step.
+
+For each step the log records the entry that received new debt, (rand_i, rand_j), and the
+banks that defaulted in each cascade round: round 0 holds the banks whose net position was
+negative, later rounds the banks that defaulted on their exposures to earlier ones. This lets
+questions such as "which banks keep defaulting" be answered without re-running the model.
+
+File layout, with all integers unsigned LEB128 varints:
+
+    b'AVEL' version size
+    per step: rand_i rand_j n_rounds, then per round: count first_id delta_id ...
+
+Trailing empty rounds are not written, so a step without defaults takes three bytes. Bank ids
+within a round are stored sorted and delta-encoded."""
+
+import os
+
+import numpy as np
+
+MAGIC = b'AVEL'
+VERSION = 1
+
+
+def encode_varint(value, out):
+    """Appends an unsigned integer to a bytearray as a LEB128 varint."""
+    value = int(value)
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """Reads a varint from `data` at `pos` and returns (value, next_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class EventLogWriter:
+    """Appends step records to an event log.
+
+    Pass an instance as the `event_log` of a TestNetwork and it receives a record per step.
+
+    Args:
+        path (str): Log file. Appended to if it exists.
+        size (int): Number of banks, stored in the header of a new log.
+        truncate_to (int): Byte offset to cut an existing log back to before appending, e.g. the
+            offset saved with a checkpoint, so that steps after the checkpoint are not logged twice.
+            0 starts a new log.
+        buffer_size (int): Bytes buffered in memory before writing to the file.
+    """
+
+    def __init__(self, path, size, truncate_to=None, buffer_size=1 << 16):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        exists = os.path.exists(path) and os.path.getsize(path) > 0 and truncate_to != 0
+        self._file = open(path, 'r+b' if exists else 'wb')
+        if exists:
+            if truncate_to is not None:
+                self._file.truncate(truncate_to)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._buffer += MAGIC
+            encode_varint(VERSION, self._buffer)
+            encode_varint(size, self._buffer)
+
+    @property
+    def offset(self):
+        """Length of the log in bytes, including records not yet flushed."""
+        return self._file.tell() + len(self._buffer)
+
+    def record(self, rand_i, rand_j, rounds):
+        """Appends one step.
+
+        Args:
+            rand_i (int): Bank that issued new debt.
+            rand_j (int): Bank it was issued to.
+            rounds (list of lists): Ids of the banks defaulting in each cascade round.
+        """
+        buf = self._buffer
+        encode_varint(rand_i, buf)
+        encode_varint(rand_j, buf)
+        n_rounds = len(rounds)
+        while n_rounds and not rounds[n_rounds - 1]:
+            n_rounds -= 1
+        encode_varint(n_rounds, buf)
+        for banks in rounds[:n_rounds]:
+            encode_varint(len(banks), buf)
+            previous = 0
+            for bank in sorted(banks):
+                encode_varint(bank - previous, buf)
+                previous = bank
+        if len(buf) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._file.flush()
+        del self._buffer[:]
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventLogReader:
+    """Reads an event log.
+
+    Args:
+        path (str): Log file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._data = fp.read()
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError(path + ' is not an event log')
+        version, pos = decode_varint(self._data, len(MAGIC))
+        if version != VERSION:
+            raise ValueError('unsupported event log version {0}'.format(version))
+        self.size, self._start = decode_varint(self._data, pos)
+
+    def __iter__(self):
+        """Yields (step, rand_i, rand_j, rounds) for every logged step."""
+        data, pos, end = self._data, self._start, len(self._data)
+        step = 0
+        while pos < end:
+            rand_i, pos = decode_varint(data, pos)
+            rand_j, pos = decode_varint(data, pos)
+            n_rounds, pos = decode_varint(data, pos)
+            rounds = []
+            for _ in range(n_rounds):
+                count, pos = decode_varint(data, pos)
+                banks = []
+                bank = 0
+                for _ in range(count):
+                    delta, pos = decode_varint(data, pos)
+                    bank += delta
+                    banks.append(bank)
+                rounds.append(banks)
+            yield step, rand_i, rand_j, rounds
+            step += 1
+
+    def replay(self, callback):
+        """Calls callback(step, rand_i, rand_j, rounds) for every logged step, in order."""
+        for record in self:
+            callback(*record)
+
+    def cascade_sizes(self):
+        """Returns the number of defaults of every step."""
+        return np.array([sum(len(banks) for banks in rounds) for _, _, _, rounds in self], dtype=np.int64)
+
+    def default_frequency(self):
+        """Returns how many steps each bank defaulted in."""
+        counts = np.zeros(self.size, dtype=np.int64)
+        for _, _, _, rounds in self:
+            for banks in rounds:
+                counts[banks] += 1
+        return counts
+
+    def co_default_matrix(self):
+        """Returns a matrix whose i,j entry counts the steps in which banks i and j both defaulted.
+
+        The diagonal equals default_frequency.
+        """
+        matrix = np.zeros((self.size, self.size), dtype=np.int64)
+        for _, _, _, rounds in self:
+            if not rounds:
+                continue
+            banks = [bank for round_banks in rounds for bank in round_banks]
+            matrix[np.ix_(banks, banks)] += 1
+        return matrix
@@ -0,0 +1,198 @@
+"""Runs jobs with network generation and simulation overlapped.
+
+Generator processes build the networks of upcoming jobs (sampling the distributions and
+solving the make_connections LP) into a bounded queue while simulator processes consume
+them. The queue bound keeps at most `queue_size` generated networks waiting in memory.
+
+Each network is sent together with the RNG state right after its generation, so a job gives
+the same result as when it is run by simulation.run_job. The matrices themselves are published
+in shared memory (see shared_network.py) and only their handles go through the queue. Generators
+also report every handle to the parent, which removes the networks no simulator consumed when
+the pipeline fails."""
+
+import multiprocessing
+import os
+import queue
+import traceback
+
+from tqdm import tqdm
+
+import shared_network
+from checkpoint import Checkpointer, get_rng_state, set_rng_state
+from shared_network import SharedNetwork, discard
+from simulation import generate_network, job_key, resume_state, simulate_and_store
+
+# Seconds to wait for a result before checking that the workers are still alive
+POLL_INTERVAL = 5
+
+
+def _generator(job_queue, network_queue, result_queue, checkpoint_paths):
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        try:
+            if os.path.exists(checkpoint_paths[job_key(job)]):
+                # Interrupted job, the simulator resumes it from its checkpoint
+                network_queue.put((job, None, None))
+            else:
+                network = SharedNetwork.publish(generate_network(job))
+                result_queue.put(('published', job_key(job), network.handle))
+                network_queue.put((job, network.handle, get_rng_state()))
+                network.close()
+        except Exception:
+            result_queue.put(('done', job_key(job), None, traceback.format_exc()))
+
+
+def _simulator(network_queue, result_queue, store_path, checkpoint_paths, checkpoint_interval, event_log_paths):
+    # Private working buffer, reused across jobs of the same size
+    mat = None
+    while True:
+        item = network_queue.get()
+        if item is None:
+            break
+        job, handle, rng_state = item
+        try:
+            checkpoint = Checkpointer(checkpoint_paths[job_key(job)], checkpoint_interval)
+            first_step, result, event_log_offset = 0, None, 0
+            if handle is None:
+                resumed = resume_state(job, checkpoint, event_log_paths.get(job_key(job)))
+                if resumed is not None:
+                    mat, first_step, result, event_log_offset = resumed
+                else:
+                    mat = generate_network(job)
+            else:
+                template = SharedNetwork.attach(handle)
+                mat = template.working_copy(mat)
+                template.close()
+                template.unlink()
+                set_rng_state(rng_state)
+            run_id = simulate_and_store(job, mat, first_step, result, store_path, checkpoint, False,
+                                        event_log_paths.get(job_key(job)), event_log_offset)
+            checkpoint.remove()
+            result_queue.put(('done', job_key(job), run_id, None))
+        except Exception:
+            result_queue.put(('done', job_key(job), None, traceback.format_exc()))
+
+
+def _drain(q):
+    """Yields the items left in a queue once the processes using it have stopped."""
+    while True:
+        try:
+            yield q.get(timeout=0.1)
+        except queue.Empty:
+            return
+        except Exception:
+            # A terminated process can leave a partly written item behind
+            return
+
+
+def _discard_networks(result_queue, network_queue, published):
+    """Removes the shared networks that were published but never consumed by a simulator."""
+    handles = list(published.values())
+    handles += [message[2] for message in _drain(result_queue) if message[0] == 'published']
+    handles += [item[1] for item in _drain(network_queue) if item is not None and item[1] is not None]
+    for handle in handles:
+        discard(handle)
+
+
+def run_pipelined(jobs, checkpoint_paths, store_path='results.sqlite', generators=1, simulators=None,
+                  queue_size=None, checkpoint_interval=50000, event_log_paths=None):
+    """Runs jobs on separate pools of generator and simulator processes.
+
+    Args:
+        jobs (list): Jobs to run (see simulation.py).
+        checkpoint_paths (dict): Checkpoint file of each job, keyed by job_key.
+        store_path (str): Results store to add the results to.
+        generators (int): Number of generator processes.
+        simulators (int): Number of simulator processes, defaults to the remaining CPUs.
+        queue_size (int): Maximum number of generated networks waiting for a simulator,
+            defaults to twice the number of simulators.
+        checkpoint_interval (int): Steps between checkpoints. None disables checkpointing.
+        event_log_paths (dict): Event log file of each job, keyed by job_key. Jobs without an
+            entry are not logged.
+
+    Returns:
+        The run ids of the jobs, in order of completion.
+
+    Raises:
+        RuntimeError: If any job failed. The other jobs still run to completion, unless a
+            worker process died (e.g. killed for running out of memory), in which case the
+            jobs without a result yet are failed instead of waited for.
+    """
+    if not jobs:
+        return []
+    if simulators is None:
+        simulators = max(multiprocessing.cpu_count() - generators, 1)
+    if queue_size is None:
+        queue_size = 2 * simulators
+
+    job_queue = multiprocessing.Queue()
+    network_queue = multiprocessing.Queue(maxsize=queue_size)
+    result_queue = multiprocessing.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(generators):
+        job_queue.put(None)
+
+    processes = [multiprocessing.Process(target=_generator,
+                                         args=(job_queue, network_queue, result_queue, checkpoint_paths))
+                 for _ in range(generators)]
+    processes += [multiprocessing.Process(target=_simulator,
+                                          args=(network_queue, result_queue, store_path, checkpoint_paths,
+                                                checkpoint_interval, event_log_paths or {}))
+                  for _ in range(simulators)]
+    shared_network.prepare()
+    for process in processes:
+        process.start()
+
+    run_ids, errors = [], []
+    outstanding = set(job_key(job) for job in jobs)
+    # Handles of the published networks whose job has not finished yet
+    published = {}
+    finished = False
+    progress = tqdm(total=len(jobs))
+    try:
+        while outstanding:
+            try:
+                message = result_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A worker that died outside Python never reports its job, stop waiting for it
+                dead = [process for process in processes if process.exitcode not in (None, 0)]
+                if dead:
+                    message = 'worker process {0} died with exit code {1}'.format(dead[0].pid, dead[0].exitcode)
+                    errors.extend((key, message) for key in sorted(outstanding))
+                    break
+                continue
+            if message[0] == 'published':
+                published[message[1]] = message[2]
+                continue
+            key, run_id, error = message[1:]
+            published.pop(key, None)
+            outstanding.discard(key)
+            progress.update()
+            if error is None:
+                run_ids.append(run_id)
+            else:
+                errors.append((key, error))
+        else:
+            # Every job has been generated, stop the simulators
+            for _ in range(simulators):
+                network_queue.put(None)
+            for process in processes:
+                process.join()
+            finished = True
+    finally:
+        progress.close()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        if not finished:
+            for process in processes:
+                process.join()
+            _discard_networks(result_queue, network_queue, published)
+
+    if errors:
+        raise RuntimeError('{0} of {1} jobs failed, first failure in {2}:\n{3}'.format(
+            len(errors), len(jobs), errors[0][0], errors[0][1]))
+    return run_ids
@@ -0,0 +1,140 @@
+"""Number formats for liabilities matrices.
+
+The networks in contagion.py run on whatever dtype their liabilities matrix has. This module
+defines the supported policies and a harness to check how far a policy moves the results away
+from float64:
+
+    float64  the reference format
+    float32  halves the memory footprint and bandwidth of the matrix
+    cents    fixed-point int64 amounts in hundredths, so netting in reset_net is exact
+
+Every step of the model draws the same random numbers regardless of the matrix values, so two
+runs of one network from the same seed can be compared step by step."""
+
+import numpy as np
+
+from contagion import DeterministicRatioNetwork, TestNetwork
+
+# policy -> (dtype, units per unit of currency)
+POLICIES = {
+    'float64': (np.float64, 1),
+    'float32': (np.float32, 1),
+    'cents': (np.int64, 100),
+}
+
+INITIAL_CAP = 10000
+
+
+def policy_dtype(policy):
+    """Returns the dtype of a policy."""
+    if policy not in POLICIES:
+        raise ValueError('unknown precision policy: ' + str(policy))
+    return POLICIES[policy][0]
+
+
+def apply_policy(mat, policy):
+    """Converts a float64 liabilities matrix to a policy's format.
+
+    Args:
+        mat (numpy ndarray): Liabilities matrix in units of currency.
+        policy (str): One of POLICIES.
+
+    Returns:
+        A new matrix in the policy's dtype and units.
+    """
+    dtype = policy_dtype(policy)
+    scale = POLICIES[policy][1]
+    if np.issubdtype(dtype, np.integer):
+        return np.round(np.asarray(mat, dtype=np.float64) * scale).astype(dtype)
+    return np.array(mat, dtype=dtype)
+
+
+def to_currency(mat, policy):
+    """Converts a matrix in a policy's format back to float64 units of currency."""
+    return np.asarray(mat, dtype=np.float64) / POLICIES[policy][1]
+
+
+def initial_cap(policy, cap=INITIAL_CAP):
+    """The networks' initial_cap expressed in a policy's units."""
+    return cap * POLICIES[policy][1]
+
+
+def cascade_sizes(mat, steps, seed, policy='float64', network='TestNetwork'):
+    """Runs a network under a policy and records the cascade size of every step.
+
+    Args:
+        mat (numpy ndarray): float64 liabilities matrix, left unchanged.
+        steps (int): Number of steps.
+        seed (int): Seed of numpy's global RNG for the steps.
+        policy (str): One of POLICIES.
+        network (str): 'TestNetwork' or 'DeterministicRatioNetwork'.
+
+    Returns:
+        A numpy array with the number of defaults of every step.
+    """
+    working = apply_policy(mat, policy)
+    size = working.shape[0]
+    cap = initial_cap(policy)
+    sizes = np.zeros(steps, dtype=np.int64)
+    np.random.seed(seed)
+    for z in range(steps):
+        if network == 'TestNetwork':
+            model = TestNetwork(size, working, initial_cap=cap)
+            model.reset_net()
+            results = model.step()
+            sizes[z] = results['ratio_defaults'] + results['cascade_defaults']
+        elif network == 'DeterministicRatioNetwork':
+            model = DeterministicRatioNetwork(size, working, initial_cap=cap)
+            model.reset_net()
+            ratios, defaults = model.step()
+            sizes[z] = defaults
+        else:
+            raise ValueError('unknown network: ' + str(network))
+    return sizes
+
+
+def drift(reference, candidate):
+    """Measures how far the cascade sizes of a run drift from a reference run.
+
+    Args:
+        reference (numpy array): Per-step cascade sizes under float64.
+        candidate (numpy array): Per-step cascade sizes of the same network and seed under another policy.
+
+    Returns:
+        A dict with
+            'step_mismatch': fraction of steps whose cascade size differs,
+            'total_variation': total variation distance between the size-to-frequency distributions,
+            'ks': Kolmogorov-Smirnov distance between the size distributions,
+            'mean_shift': difference of the mean cascade sizes.
+    """
+    width = max(reference.max(), candidate.max()) + 1
+    p = np.bincount(reference, minlength=width) / float(len(reference))
+    q = np.bincount(candidate, minlength=width) / float(len(candidate))
+    return {
+        'step_mismatch': float(np.mean(reference != candidate)),
+        'total_variation': float(0.5 * np.abs(p - q).sum()),
+        'ks': float(np.abs(np.cumsum(p) - np.cumsum(q)).max()),
+        'mean_shift': float(candidate.mean() - reference.mean()),
+    }
+
+
+def validate(mat, steps=100000, seed=0, policies=('float32', 'cents'), network='TestNetwork'):
+    """Compares policies against float64 on one network.
+
+    Args:
+        mat (numpy ndarray): float64 liabilities matrix, e.g. from simulation.generate_network.
+        steps (int): Number of steps per run.
+        seed (int): Seed used for every run.
+        policies (iterable of str): Policies to compare.
+        network (str): 'TestNetwork' or 'DeterministicRatioNetwork'.
+
+    Returns:
+        A dict from policy to its drift (see drift), plus the matrix size in bytes as 'nbytes'.
+    """
+    reference = cascade_sizes(mat, steps, seed, 'float64', network)
+    report = {}
+    for policy in policies:
+        candidate = cascade_sizes(mat, steps, seed, policy, network)
+        report[policy] = drift(reference, candidate)
+        report[policy]['nbytes'] = np.dtype(policy_dtype(policy)).itemsize * mat.size
+    return report
@@ -0,0 +1,241 @@
+"""A single-file SQLite store for simulation results.
+
+Every run is one row holding its configuration and the histogram or timeline as a compressed
+binary blob. The configuration columns and the distribution parameters are indexed, so finding
+e.g. all beta/beta runs with Alpha=2 is a query instead of a walk over the file system."""
+
+import json
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+from distributions import parse_label, parse_result_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    network TEXT NOT NULL,
+    cash_family TEXT,
+    cash_label TEXT NOT NULL,
+    leverage_family TEXT,
+    leverage_label TEXT NOT NULL,
+    size INTEGER,
+    seed INTEGER,
+    steps INTEGER,
+    precision TEXT NOT NULL DEFAULT 'float64',
+    created REAL NOT NULL,
+    dtype TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (kind, cash_family, leverage_family, network);
+CREATE INDEX IF NOT EXISTS runs_labels ON runs (cash_label, leverage_label);
+CREATE INDEX IF NOT EXISTS runs_seed ON runs (seed);
+CREATE INDEX IF NOT EXISTS runs_steps ON runs (steps);
+CREATE INDEX IF NOT EXISTS params_lookup ON params (role, name, value);
+CREATE INDEX IF NOT EXISTS params_run ON params (run_id);
+"""
+
+META_COLUMNS = ['id', 'kind', 'network', 'cash_family', 'cash_label', 'leverage_family',
+                'leverage_label', 'size', 'seed', 'steps', 'precision', 'created']
+
+
+def encode_array(arr):
+    """Packs an array into a compressed blob using the smallest dtype that holds it exactly.
+
+    Args:
+        arr (numpy ndarray): Histogram or timeline.
+
+    Returns:
+        A (blob, dtype_name, shape_string) tuple.
+    """
+    arr = np.asarray(arr)
+    if arr.size and np.array_equal(arr, np.round(arr)) and arr.min() >= 0:
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if arr.max() <= np.iinfo(dtype).max:
+                arr = arr.astype(dtype)
+                break
+    arr = np.ascontiguousarray(arr)
+    return zlib.compress(arr.tobytes()), arr.dtype.str, json.dumps(list(arr.shape))
+
+
+def decode_array(blob, dtype, shape):
+    """Inverse of encode_array."""
+    return np.frombuffer(zlib.decompress(blob), dtype=np.dtype(dtype)).reshape(json.loads(shape))
+
+
+class ResultsStore:
+    """Indexed store of histograms and timelines.
+
+    Args:
+        path (str): SQLite file, created on first use.
+    """
+
+    def __init__(self, path='results.sqlite'):
+        self.path = path
+        # Sweep workers write concurrently, wait for the lock instead of failing
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(runs)')]
+        if 'precision' not in columns:
+            # Stores created before precision policies existed only hold float64 runs
+            with self.connection:
+                self.connection.execute("ALTER TABLE runs ADD COLUMN precision TEXT NOT NULL DEFAULT 'float64'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, kind, data, network, cash_label='', leverage_label='', size=None, seed=None, steps=None,
+                precision='float64'):
+        """Stores one run.
+
+        Args:
+            kind (str): 'frequency' for size-to-frequency histograms, 'timeline' for per-step defaults.
+            data (numpy ndarray): The histogram or timeline.
+            network (str): Network class used, e.g. 'TestNetwork'.
+            cash_label (str): Output of generateCashString.
+            leverage_label (str): Output of generateLeverageString.
+            size (int): Number of banks.
+            seed (int): Seed the run was started from.
+            steps (int): Number of steps simulated.
+            precision (str): Number format of the liabilities matrix, see precision.py.
+
+        Returns:
+            The id of the new run.
+        """
+        blob, dtype, shape = encode_array(data)
+        cash_family, cash_params = parse_label(cash_label)
+        leverage_family, leverage_params = parse_label(leverage_label)
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (kind, network, cash_family, cash_label, leverage_family, leverage_label, '
+                'size, seed, steps, precision, created, dtype, shape, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (kind, network, cash_family, cash_label, leverage_family, leverage_label,
+                 size, seed, steps, precision, time.time(), dtype, shape, sqlite3.Binary(blob)))
+            run_id = cursor.lastrowid
+            rows = [(run_id, 'cash', name, value) for name, value in cash_params.items()]
+            rows += [(run_id, 'leverage', name, value) for name, value in leverage_params.items()]
+            self.connection.executemany('INSERT INTO params (run_id, role, name, value) VALUES (?, ?, ?, ?)', rows)
+        return run_id
+
+    def _where(self, kind=None, network=None, cash=None, leverage=None, cash_label=None, leverage_label=None,
+               size=None, seed=None, steps=None, precision=None, cash_params=None, leverage_params=None):
+        clauses, args = [], []
+        for column, value in (('kind', kind), ('network', network), ('cash_family', cash),
+                              ('leverage_family', leverage), ('cash_label', cash_label),
+                              ('leverage_label', leverage_label), ('size', size), ('seed', seed), ('steps', steps),
+                              ('precision', precision)):
+            if value is not None:
+                clauses.append('runs.{0} = ?'.format(column))
+                args.append(value)
+        for role, params in (('cash', cash_params), ('leverage', leverage_params)):
+            for name, value in (params or {}).items():
+                clauses.append('runs.id IN (SELECT run_id FROM params WHERE role = ? AND name = ? AND value = ?)')
+                args.extend([role, name, value])
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', args
+
+    def find(self, **query):
+        """Looks up runs without loading their data.
+
+        Keyword args:
+            kind, network, size, seed, steps, precision: Match the column exactly.
+            cash, leverage: Distribution family, e.g. 'beta'.
+            cash_label, leverage_label: Full configuration label.
+            cash_params, leverage_params: Dicts of parameter name to value, e.g. {'Alpha': 2}.
+
+        Returns:
+            A list of dicts with the keys in META_COLUMNS, ordered by id.
+        """
+        where, args = self._where(**query)
+        cursor = self.connection.execute(
+            'SELECT {0} FROM runs{1} ORDER BY runs.id'.format(', '.join(META_COLUMNS), where), args)
+        return [dict(zip(META_COLUMNS, row)) for row in cursor]
+
+    def exists(self, **query):
+        """Returns True if at least one run matches the query (see find)."""
+        where, args = self._where(**query)
+        return self.connection.execute('SELECT 1 FROM runs{0} LIMIT 1'.format(where), args).fetchone() is not None
+
+    def load(self, run_id):
+        """Returns the histogram or timeline of one run."""
+        row = self.connection.execute('SELECT data, dtype, shape FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(run_id)
+        return decode_array(*row)
+
+    def load_all(self, **query):
+        """Returns (metadata, data) pairs for all runs matching the query (see find)."""
+        where, args = self._where(**query)
+        cursor = self.connection.execute(
+            'SELECT {0}, data, dtype, shape FROM runs{1} ORDER BY runs.id'.format(', '.join(META_COLUMNS), where), args)
+        n = len(META_COLUMNS)
+        return [(dict(zip(META_COLUMNS, row[:n])), decode_array(*row[n:])) for row in cursor]
+
+    def delete(self, run_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+
+
+def load_histogram(path):
+    """Loads a size-to-frequency JSON file as a dense array.
+
+    Args:
+        path (str): Path to the result file.
+
+    Returns:
+        A numpy array where entry k is the number of steps with a cascade of size k.
+    """
+    with open(path) as fp:
+        raw = json.load(fp)
+    sizes = np.fromiter((int(size) for size in raw), dtype=np.int64, count=len(raw))
+    freqs = np.fromiter((int(freq) for freq in raw.values()), dtype=np.int64, count=len(raw))
+    counts = np.zeros(sizes.max() + 1 if len(sizes) else 1, dtype=np.int64)
+    counts[sizes] = freqs
+    return counts
+
+
+def frequency_histogram(defaults_to_freq):
+    """Turns the drivers' {cascade size: frequency} dict into a dense histogram."""
+    counts = np.zeros(max(defaults_to_freq) + 1 if defaults_to_freq else 1, dtype=np.int64)
+    for defaults, freq in defaults_to_freq.items():
+        counts[int(defaults)] += freq
+    return counts
+
+
+def import_result_files(store, paths, size=100):
+    """Copies existing size-to-frequency JSON files into the store.
+
+    Args:
+        store (ResultsStore): Destination store.
+        paths (iterable of str): Result files to import.
+        size (int): Number of banks the files were generated with.
+
+    Returns:
+        The ids of the imported runs.
+    """
+    ids = []
+    for path in paths:
+        key = parse_result_name(path)
+        if key is None:
+            continue
+        network, cash_label, leverage_label = key
+        counts = load_histogram(path)
+        ids.append(store.add_run('frequency', counts, network or 'TestNetwork', cash_label, leverage_label,
+                                 size=size, steps=int(counts.sum())))
+    return ids
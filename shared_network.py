@@ -0,0 +1,148 @@
+"""Publishes a generated liabilities matrix once so that other processes can attach to it
+without pickling a copy per worker.
+
+The matrix is placed in POSIX shared memory (multiprocessing.shared_memory, Python 3.8+) or,
+where that is unavailable, in a memory-mapped file. Attached processes see it read-only and
+copy it into a private working buffer before running TestNetwork or
+DeterministicRatioNetwork steps on it, since both update the matrix in place.
+
+    network = SharedNetwork.publish(mat)            # in the generating process
+    handle = network.handle                         # small and cheap to pickle
+
+    template = SharedNetwork.attach(handle)         # in a worker
+    mat = template.working_copy()
+    template.close()"""
+
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    resource_tracker = shared_memory = None
+
+DEFAULT_BACKEND = 'shm' if shared_memory is not None else 'mmap'
+
+
+def spool_dir():
+    """Directory for memory-mapped networks, RAM-backed where the OS provides one."""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def prepare():
+    """Must be called in the parent before starting processes that exchange shared networks.
+
+    Starts the shared memory resource tracker so that all child processes share it, otherwise
+    a segment published by one child could be removed when that child exits.
+    """
+    if resource_tracker is not None:
+        resource_tracker.ensure_running()
+
+
+class SharedNetwork:
+    """A liabilities matrix in shared memory.
+
+    Use SharedNetwork.publish to create one and SharedNetwork.attach to open it in another process.
+
+    Args:
+        handle (dict): Backend, name, shape and dtype of the shared matrix.
+        buffer: The underlying SharedMemory or numpy memmap.
+        array (numpy ndarray): View of the shared matrix.
+    """
+
+    def __init__(self, handle, buffer, array):
+        self.handle = handle
+        self._buffer = buffer
+        self.array = array
+
+    @classmethod
+    def publish(cls, mat, backend=DEFAULT_BACKEND):
+        """Copies a matrix into a new shared segment.
+
+        Args:
+            mat (numpy ndarray): Matrix to publish.
+            backend (str): 'shm' for POSIX shared memory, 'mmap' for a memory-mapped file.
+
+        Returns:
+            The SharedNetwork owning the segment. Call unlink once no process needs it anymore.
+        """
+        mat = np.ascontiguousarray(mat)
+        handle = {'backend': backend, 'shape': list(mat.shape), 'dtype': mat.dtype.str}
+        if backend == 'shm':
+            if shared_memory is None:
+                raise ValueError("the 'shm' backend requires Python 3.8 or newer")
+            buffer = shared_memory.SharedMemory(create=True, size=max(mat.nbytes, 1))
+            handle['name'] = buffer.name
+            array = np.ndarray(mat.shape, dtype=mat.dtype, buffer=buffer.buf)
+        elif backend == 'mmap':
+            handle['name'] = os.path.join(spool_dir(), 'avalanche_' + uuid.uuid4().hex + '.dat')
+            buffer = array = np.memmap(handle['name'], dtype=mat.dtype, mode='w+', shape=mat.shape)
+        else:
+            raise ValueError('unknown backend: ' + str(backend))
+        array[...] = mat
+        array.flags.writeable = False
+        return cls(handle, buffer, array)
+
+    @classmethod
+    def attach(cls, handle):
+        """Opens a published matrix read-only.
+
+        Args:
+            handle (dict): The handle of the published SharedNetwork.
+
+        Returns:
+            A SharedNetwork whose array is a read-only view of the shared matrix.
+        """
+        shape, dtype = tuple(handle['shape']), np.dtype(handle['dtype'])
+        if handle['backend'] == 'shm':
+            buffer = shared_memory.SharedMemory(name=handle['name'])
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer.buf)
+            array.flags.writeable = False
+        elif handle['backend'] == 'mmap':
+            buffer = array = np.memmap(handle['name'], dtype=dtype, mode='r', shape=shape)
+        else:
+            raise ValueError('unknown backend: ' + str(handle['backend']))
+        return cls(handle, buffer, array)
+
+    def working_copy(self, out=None):
+        """Copies the shared matrix into a private, writable buffer.
+
+        Args:
+            out (numpy ndarray): Buffer to reuse if it has the right shape and dtype.
+
+        Returns:
+            The private copy.
+        """
+        if out is None or out.shape != self.array.shape or out.dtype != self.array.dtype:
+            out = np.empty(self.array.shape, dtype=self.array.dtype)
+        np.copyto(out, self.array)
+        return out
+
+    def close(self):
+        """Detaches this process from the shared matrix. The array must not be used afterwards."""
+        self.array = None
+        if self.handle['backend'] == 'shm':
+            self._buffer.close()
+        # Dropping the last reference to a memmap unmaps it
+        self._buffer = None
+
+    def unlink(self):
+        """Removes the shared matrix from the system once every process has closed it."""
+        if self.handle['backend'] == 'shm':
+            segment = self._buffer if self._buffer is not None else shared_memory.SharedMemory(name=self.handle['name'])
+            segment.unlink()
+            if segment is not self._buffer:
+                segment.close()
+        elif os.path.exists(self.handle['name']):
+            os.remove(self.handle['name'])
+
+
+def discard(handle):
+    """Removes a published matrix by its handle, if it has not been removed already."""
+    try:
+        SharedNetwork(handle, None, None).unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,270 @@
+"""Runs the avalanche model for a job and adds the result to the results store.
+
+A job is a dict describing one run:
+
+    {'kind': 'frequency',            # 'frequency' for a size-to-frequency histogram, 'timeline' for per-step defaults
+     'network': 'TestNetwork',       # or 'DeterministicRatioNetwork'
+     'cash': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}},
+     'leverage': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40}},
+     'size': 100,
+     'steps': 1000000,
+     'seed': 0,
+     'run': 0}                       # index of the run within its batch
+
+An optional 'precision' key selects the number format of the liabilities matrix, see
+precision.py. It defaults to 'float64'.
+
+The same job always produces the same result."""
+
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from contagion import binarize_probabilities, distribute_liabilities, make_connections, DeterministicRatioNetwork, TestNetwork
+from distributions import label, sample
+from event_log import EventLogWriter
+from precision import apply_policy, initial_cap
+from results_store import ResultsStore
+
+NETWORKS = ['TestNetwork', 'DeterministicRatioNetwork']
+KINDS = ['frequency', 'timeline']
+
+
+def job_key(job):
+    """Canonical string identifying a job."""
+    return json.dumps(job, sort_keys=True)
+
+
+def job_labels(job):
+    """Returns the (cash_label, leverage_label) the job's result is stored under."""
+    return label(job['cash'], 'cash'), label(job['leverage'], 'leverage')
+
+
+def job_precision(job):
+    """Returns the precision policy of a job."""
+    return job.get('precision', 'float64')
+
+
+def is_done(store, job):
+    """Returns True if the result of a job is already in the store."""
+    cash_label, leverage_label = job_labels(job)
+    return store.exists(kind=job['kind'], network=job['network'], cash_label=cash_label,
+                        leverage_label=leverage_label, size=job['size'], seed=job['seed'], steps=job['steps'],
+                        precision=job_precision(job))
+
+
+def safe_ln(x, minval=0.000000000001):
+    """Log of x clipped away from zero, truncated to integers."""
+    return np.log(x.clip(min=minval)).astype(int)
+
+
+def generate_network(job):
+    """Generates the liabilities matrix of a job's network.
+
+    Seeds numpy's global RNG with the job's seed, so the RNG state afterwards is part of the
+    job's deterministic sequence.
+
+    Args:
+        job (dict): Job description.
+
+    Returns:
+        The liabilities matrix with each bank's cash on the diagonal, in the job's precision.
+    """
+    np.random.seed(job['seed'])
+    size = job['size']
+
+    cash_vector = sample(job['cash'], size, 'cash')
+    cash_vector[cash_vector <= 0] = 1 * 10 ** -10
+    connectivity_vector = safe_ln(cash_vector)
+
+    # Make the adjacency matrix
+    mat = make_connections(connectivity_vector)
+    mat = binarize_probabilities(mat)
+
+    # Distribute liabilities
+    leverage_ratios = sample(job['leverage'], size, 'leverage')
+    leverage_ratios[leverage_ratios < 5] = 5
+
+    liabilities = np.multiply(cash_vector, leverage_ratios)
+    mat = distribute_liabilities(mat, liabilities)
+    for i, cash in enumerate(cash_vector):
+        mat[i, i] = cash
+    if job_precision(job) != 'float64':
+        mat = apply_policy(mat, job_precision(job))
+    return mat
+
+
+def run_step(network, size, mat, cap=10000, event_log=None):
+    """Runs one step of the model on `mat`, which is updated in place.
+
+    Args:
+        network (str): 'TestNetwork' or 'DeterministicRatioNetwork'.
+        size (int): Number of banks.
+        mat (numpy ndarray): Liabilities matrix.
+        cap (int): Capital of banks entering the network, in the units of `mat`.
+        event_log (EventLogWriter): Receives the defaulted banks of the step, TestNetwork only.
+
+    Returns:
+        A (ratio_defaults, cascade_defaults) tuple.
+    """
+    if network == 'TestNetwork':
+        model = TestNetwork(size, mat, initial_cap=cap, event_log=event_log)
+        model.reset_net()
+        results = model.step()
+        return results['ratio_defaults'], results['cascade_defaults']
+    elif network == 'DeterministicRatioNetwork':
+        model = DeterministicRatioNetwork(size, mat, initial_cap=cap)
+        model.reset_net()
+        ratios, defaults = model.step()
+        return defaults, 0
+    raise ValueError('unknown network: ' + str(network))
+
+
+def new_result(job):
+    """Returns the empty histogram or timeline of a job."""
+    if job['kind'] == 'frequency':
+        return np.zeros(job['size'] + 1, dtype=np.int64)
+    elif job['kind'] == 'timeline':
+        return np.zeros((job['steps'], 2), dtype=np.uint16)
+    raise ValueError('unknown kind: ' + str(job['kind']))
+
+
+def simulate(job, mat, first_step=0, result=None, checkpoint=None, progress=True, event_log=None):
+    """Runs the steps of a job on an already generated network.
+
+    Args:
+        job (dict): Job description.
+        mat (numpy ndarray): Liabilities matrix, updated in place.
+        first_step (int): Step to start from when resuming.
+        result (numpy ndarray): Partial result when resuming.
+        checkpoint (Checkpointer): Where to save the run's state periodically.
+        progress (bool): Show a progress bar.
+        event_log (EventLogWriter): Receives the defaulted banks of every step.
+
+    Returns:
+        The histogram or timeline of the run.
+    """
+    if event_log is not None and job['network'] != 'TestNetwork':
+        raise ValueError('event logs are only recorded for TestNetwork')
+    if result is None:
+        result = new_result(job)
+    key = job_key(job)
+    network, size, steps, timeline = job['network'], job['size'], job['steps'], job['kind'] == 'timeline'
+    cap = initial_cap(job_precision(job))
+
+    for z in tqdm(range(first_step, steps), initial=first_step, total=steps, disable=not progress):
+        ratio_defaults, cascade_defaults = run_step(network, size, mat, cap, event_log)
+        if timeline:
+            result[z, 0] = ratio_defaults
+            result[z, 1] = cascade_defaults
+        else:
+            result[ratio_defaults + cascade_defaults] += 1
+
+        if checkpoint is not None and checkpoint.due(z + 1):
+            extra = {}
+            if event_log is not None:
+                # The log must hold every step up to the checkpoint before its length is saved
+                event_log.flush()
+                extra['event_log_offset'] = event_log.offset
+            checkpoint.save(job=key, run=job.get('run', 0), step=z + 1, liabilities=mat,
+                            result=result[:z + 1] if timeline else result, **extra)
+    return result
+
+
+def event_log_resumable(event_log_path, event_log_offset):
+    """Returns True if an event log holds every step up to a checkpoint saved at event_log_offset.
+
+    The offset is None when the checkpoint was written without an event log.
+    """
+    return (event_log_offset is not None and os.path.exists(event_log_path) and
+            os.path.getsize(event_log_path) >= event_log_offset)
+
+
+def resume_state(job, checkpoint, event_log_path=None):
+    """Loads the checkpoint of an interrupted job.
+
+    Args:
+        job (dict): Job description.
+        checkpoint (Checkpointer): Checkpoint of the job.
+        event_log_path (str): Event log the resumed run appends to. If it does not hold the
+            steps before the checkpoint (the run was not logging, or the log was deleted), the
+            checkpoint is ignored so the job restarts from step 0 with a complete log.
+
+    Returns:
+        A (mat, first_step, result, event_log_offset) tuple, or None if the job has to start
+        from step 0. event_log_offset is None if the run was not logging events. The global
+        RNG is restored when a state is returned.
+    """
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is None or state.get('job') != job_key(job):
+        return None
+    if event_log_path is not None and not event_log_resumable(event_log_path, state.get('event_log_offset')):
+        return None
+    result = new_result(job)
+    if job['kind'] == 'timeline':
+        result[:state['step']] = state['result']
+    else:
+        result[:] = state['result']
+    checkpoint.restore_rng(state)
+    return state['liabilities'], state['step'], result, state.get('event_log_offset')
+
+
+def store_result(job, result, store_path):
+    """Adds a job's result to the results store and returns its run id."""
+    cash_label, leverage_label = job_labels(job)
+    with ResultsStore(store_path) as store:
+        return store.add_run(job['kind'], result, job['network'], cash_label, leverage_label,
+                             size=job['size'], seed=job['seed'], steps=job['steps'],
+                             precision=job_precision(job))
+
+
+def run_job(job, store_path='results.sqlite', checkpoint=None, progress=True, event_log_path=None):
+    """Generates the network of a job, simulates it and stores the result.
+
+    If `checkpoint` holds the state of an interrupted run of the same job, the run resumes
+    from there and gives the same result as an uninterrupted run.
+
+    Args:
+        job (dict): Job description.
+        store_path (str): Results store to add the result to.
+        checkpoint (Checkpointer): Where to save the run's state periodically.
+        progress (bool): Show a progress bar.
+        event_log_path (str): Record the defaulted banks of every step in this event log.
+
+    Returns:
+        The run id in the results store.
+    """
+    resumed = resume_state(job, checkpoint, event_log_path)
+    if resumed is not None:
+        mat, first_step, result, event_log_offset = resumed
+    else:
+        mat, first_step, result, event_log_offset = generate_network(job), 0, None, 0
+    return simulate_and_store(job, mat, first_step, result, store_path, checkpoint, progress,
+                              event_log_path, event_log_offset)
+
+
+def simulate_and_store(job, mat, first_step, result, store_path, checkpoint=None, progress=True,
+                       event_log_path=None, event_log_offset=0):
+    """Runs simulate with an optional event log and stores the result.
+
+    event_log_offset is the log length saved with the checkpoint being resumed from, or 0 to
+    start a new log.
+
+    Raises:
+        ValueError: If a run resumed at first_step > 0 would append to an event log that does
+            not hold the steps before it.
+    """
+    event_log = None
+    if event_log_path is not None:
+        if first_step > 0 and not event_log_resumable(event_log_path, event_log_offset):
+            raise ValueError('event log {0} does not hold the {1} steps before the checkpoint'.format(
+                event_log_path, first_step))
+        event_log = EventLogWriter(event_log_path, job['size'], truncate_to=event_log_offset or 0)
+    try:
+        result = simulate(job, mat, first_step, result, checkpoint, progress, event_log)
+    finally:
+        if event_log is not None:
+            event_log.close()
+    return store_result(job, result, store_path)
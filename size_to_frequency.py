@@ -3,7 +3,6 @@
 import json
 from tqdm import tqdm
 import numpy as np
-import cvxpy as cvx
 from contagion import binarize_probabilities, distribute_liabilities, make_connections, DeterministicRatioNetwork, TestNetwork
 
 
@@ -0,0 +1,185 @@
+"""Runs a parameter sweep of the avalanche model described by a JSON spec.
+
+The spec lists the distribution families with their parameter grids, the network classes,
+step counts and number of runs, e.g.
+
+    {
+        "kind": "frequency",
+        "networks": ["TestNetwork"],
+        "size": 100,
+        "steps": [1000000],
+        "runs": 10,
+        "seed": 0,
+        "cash": [{"family": "beta", "params": {"Alpha": [2, 3], "Beta": 8, "Scale": 40000}}],
+        "leverage": [{"family": "beta", "params": {"Alpha": 2, "Beta": 8, "Scale": 40}}]
+    }
+
+An optional "precision" entry (a policy from precision.py or a list of them) adds the number
+format of the liabilities matrix to the grid.
+
+Every combination of kind, network, steps, cash and leverage distribution (with list-valued
+parameters expanded into their grid) is run `runs` times with seeds seed, seed + 1, ...
+Jobs whose results are already in the results store are skipped, and jobs interrupted
+mid-run resume from their checkpoint, so running the same spec again continues the sweep.
+
+It can be run on the command-line with 'python sweep.py <spec.json> --workers 8'. Add --pipeline
+to generate networks in dedicated processes ahead of the simulation (see pipeline.py)."""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+
+from tqdm import tqdm
+
+from checkpoint import Checkpointer
+from pipeline import run_pipelined
+from results_store import ResultsStore
+from simulation import is_done, job_key, run_job
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def expand_distribution(distribution):
+    """Expands list-valued parameters of a distribution into all combinations.
+
+    Args:
+        distribution (dict): Distribution with 'family' and 'params' keys.
+
+    Returns:
+        A list of distributions with scalar parameters.
+    """
+    names = list(distribution['params'])
+    grids = [_as_list(distribution['params'][name]) for name in names]
+    return [{'family': distribution['family'], 'params': dict(zip(names, values))}
+            for values in itertools.product(*grids)]
+
+
+def expand_spec(spec):
+    """Expands a sweep spec into its list of jobs (see simulation.py for the job format)."""
+    cash = [dist for entry in _as_list(spec['cash']) for dist in expand_distribution(entry)]
+    leverage = [dist for entry in _as_list(spec['leverage']) for dist in expand_distribution(entry)]
+    seed = spec.get('seed', 0)
+    jobs = []
+    for kind, network, steps, cash_dist, leverage_dist, run in itertools.product(
+            _as_list(spec.get('kind', 'frequency')), _as_list(spec.get('networks', 'TestNetwork')),
+            _as_list(spec['steps']), cash, leverage, range(spec.get('runs', 1))):
+        job = {'kind': kind, 'network': network, 'cash': cash_dist, 'leverage': leverage_dist,
+               'size': spec.get('size', 100), 'steps': steps, 'seed': seed + run, 'run': run}
+        jobs.append(job)
+    if 'precision' in spec:
+        jobs = [dict(job, precision=precision) for precision in _as_list(spec['precision']) for job in jobs]
+    return jobs
+
+
+def pending_jobs(jobs, store_path):
+    """Filters out the jobs whose results are already in the store."""
+    with ResultsStore(store_path) as store:
+        return [job for job in jobs if not is_done(store, job)]
+
+
+def job_file(directory, job, extension):
+    """Path of a per-job file, named after a hash of the job."""
+    digest = hashlib.sha1(job_key(job).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, 'job_' + digest + extension)
+
+
+def checkpoint_path(checkpoint_dir, job):
+    """Checkpoint file of a job."""
+    return job_file(checkpoint_dir, job, '.npz')
+
+
+def event_log_path(event_log_dir, job):
+    """Event log file of a job, or None if event logging is off.
+
+    Only TestNetwork records events, jobs of other networks are run without a log so that a
+    sweep over several networks still runs every job.
+    """
+    if not event_log_dir or job['network'] != 'TestNetwork':
+        return None
+    return job_file(event_log_dir, job, '.avel')
+
+
+def _run(args):
+    job, store_path, checkpoint_dir, checkpoint_interval, event_log_dir = args
+    checkpoint = Checkpointer(checkpoint_path(checkpoint_dir, job), checkpoint_interval)
+    run_id = run_job(job, store_path, checkpoint, progress=False, event_log_path=event_log_path(event_log_dir, job))
+    checkpoint.remove()
+    return run_id
+
+
+def run_sweep(jobs, store_path='results.sqlite', workers=None, checkpoint_dir='checkpoints',
+              checkpoint_interval=50000, pipeline=False, generators=1, queue_size=None, event_log_dir=None):
+    """Runs the jobs that are not in the store yet across a pool of worker processes.
+
+    Args:
+        jobs (list): Jobs from expand_spec.
+        store_path (str): Results store.
+        workers (int): Number of worker processes, defaults to the number of CPUs. In
+            pipelined mode this is the number of simulator processes.
+        checkpoint_dir (str): Directory for the per-job checkpoints.
+        checkpoint_interval (int): Steps between checkpoints. None disables checkpointing.
+        pipeline (bool): Generate networks in separate processes ahead of the simulators
+            (see pipeline.py) instead of each worker generating its own.
+        generators (int): Number of generator processes in pipelined mode.
+        queue_size (int): Maximum number of generated networks waiting in pipelined mode.
+        event_log_dir (str): Record the defaulted banks of every step of every TestNetwork job
+            in an event log in this directory (see event_log.py). None disables event logs.
+
+    Returns:
+        The run ids of the jobs run.
+    """
+    jobs = pending_jobs(jobs, store_path)
+    if not jobs:
+        return []
+    if checkpoint_interval:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    if event_log_dir:
+        os.makedirs(event_log_dir, exist_ok=True)
+    if pipeline:
+        paths = {job_key(job): checkpoint_path(checkpoint_dir, job) for job in jobs}
+        log_paths = {job_key(job): event_log_path(event_log_dir, job) for job in jobs} if event_log_dir else None
+        return run_pipelined(jobs, paths, store_path, generators, workers, queue_size, checkpoint_interval,
+                             log_paths)
+    tasks = [(job, store_path, checkpoint_dir, checkpoint_interval, event_log_dir) for job in jobs]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return list(tqdm(pool.imap_unordered(_run, tasks), total=len(tasks)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of the avalanche model.')
+    parser.add_argument('spec', help='JSON sweep spec')
+    parser.add_argument('--store', default='results.sqlite', help='results store to add the results to')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--checkpoint-dir', default='checkpoints', help='directory for per-job checkpoints')
+    parser.add_argument('--checkpoint-interval', type=int, default=50000, help='steps between checkpoints, 0 disables')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='generate networks in separate processes ahead of the simulators')
+    parser.add_argument('--generators', type=int, default=1, help='generator processes in pipelined mode')
+    parser.add_argument('--queue-size', type=int, help='generated networks allowed to wait in pipelined mode')
+    parser.add_argument('--event-log-dir', help='record the defaulted banks of every step in event logs here')
+    parser.add_argument('--dry-run', action='store_true', help='only print the jobs that would run')
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as fp:
+        jobs = expand_spec(json.load(fp))
+    if args.dry_run:
+        pending = pending_jobs(jobs, args.store)
+        for job in pending:
+            print(job_key(job))
+        print('{0} of {1} jobs pending'.format(len(pending), len(jobs)))
+        return
+    run_sweep(jobs, args.store, args.workers, args.checkpoint_dir, args.checkpoint_interval,
+              args.pipeline, args.generators, args.queue_size, args.event_log_dir)
+
+
+if __name__ == '__main__':
+    main()
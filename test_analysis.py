@@ -0,0 +1,69 @@
+"""Checks the power-law fits of analysis.py against known exponents and a direct optimization.
+
+Run with 'python -m pytest test_analysis.py'."""
+
+import argparse
+
+import numpy as np
+import pytest
+from scipy.optimize import minimize_scalar
+from scipy.special import zeta
+
+import analysis
+
+
+def sample_power_law(alpha, events, width=101, seed=0):
+    """Histogram of `events` draws from a discrete power law on 1 .. width - 1."""
+    sizes = np.arange(1, width)
+    p = sizes ** -float(alpha)
+    counts = np.random.RandomState(seed).multinomial(events, p / p.sum())
+    return np.concatenate(([0], counts))
+
+
+def direct_mle(counts, xmin):
+    sizes = np.arange(len(counts))
+    tail = np.where(sizes >= xmin, counts, 0)
+    log_sum = tail.dot(np.log(np.maximum(sizes, 1)))
+    result = minimize_scalar(lambda a: tail.sum() * np.log(zeta(a, xmin)) + a * log_sum,
+                             bounds=(1.0001, 49), method='bounded', options={'xatol': 1e-9})
+    return result.x
+
+
+@pytest.mark.parametrize('alpha', [2.0, 2.5, 3.0])
+def test_fit_recovers_exponent(alpha):
+    # Untruncated enough that the tail beyond 10000 does not matter
+    counts = sample_power_law(alpha, 200000, width=10001)[None, :]
+    fitted, stderr, n = analysis.fit_power_law(counts, 1)
+    assert abs(fitted[0] - alpha) < 4 * stderr[0] + 0.01
+    low, high = analysis.bootstrap_power_law(counts, 1, samples=200)
+    assert low[0] < fitted[0] < high[0]
+
+
+@pytest.mark.parametrize('counts, xmin', [([0, 1000, 1, 0], 1), ([0, 5, 1000], 1), ([0, 0, 0, 500, 400, 300, 10], 3)])
+def test_fit_matches_direct_mle_outside_table(counts, xmin):
+    fitted, stderr, n = analysis.fit_power_law(np.array([counts]), xmin)
+    assert fitted[0] == pytest.approx(direct_mle(np.array(counts), xmin), abs=1e-5)
+    assert np.isfinite(stderr[0])
+
+
+def test_fit_without_finite_estimate_is_nan():
+    # Every event at xmin, the likelihood grows without bound
+    fitted, stderr, n = analysis.fit_power_law(np.array([[0, 1000, 0], [0, 0, 0]]), 1)
+    assert np.isnan(fitted).all() and np.isnan(stderr).all()
+
+
+def test_xmin_below_one_is_rejected():
+    with pytest.raises(ValueError):
+        analysis.fit_power_law(np.array([[1, 2, 3]]), 0)
+    with pytest.raises(argparse.ArgumentTypeError):
+        analysis._xmin_arg('0')
+
+
+def test_summarize_groups_by_precision():
+    counts = sample_power_law(2.5, 20000)
+    groups = {('TestNetwork', 'a_', 'b_', 'float64'): (counts, 2),
+              ('TestNetwork', 'a_', 'b_', 'float32'): (counts[:50], 1)}
+    rows = analysis.summarize(groups, 'auto', samples=50)
+    assert [row['precision'] for row in rows] == ['float32', 'float64']
+    assert all(set(row) == set(analysis.SUMMARY_COLUMNS) for row in rows)
+    assert all(row['xmin'] >= 1 for row in rows)
@@ -0,0 +1,118 @@
+"""Checks the event log format and that resumed runs keep their event logs complete.
+
+make_connections is replaced by a seeded random matrix so the tests do not need cvxpy.
+
+Run with 'python -m pytest test_event_log.py'."""
+
+import os
+
+import numpy as np
+import pytest
+
+import simulation
+from checkpoint import Checkpointer
+from event_log import EventLogReader, EventLogWriter, decode_varint, encode_varint
+from results_store import ResultsStore
+
+STEPS = 300
+INTERVAL = 50
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def stub_connections(monkeypatch):
+    monkeypatch.setattr(simulation, 'make_connections',
+                        lambda connectivity: np.random.random_sample((len(connectivity), len(connectivity))))
+
+
+def make_job():
+    return {'kind': 'timeline', 'network': 'TestNetwork',
+            'cash': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}},
+            'leverage': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40}},
+            'size': 10, 'steps': STEPS, 'seed': 3, 'run': 0}
+
+
+def read_bytes(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def interrupt_after(monkeypatch, steps):
+    run_step = simulation.run_step
+    calls = [0]
+
+    def interrupting_step(*args):
+        calls[0] += 1
+        if calls[0] > steps:
+            raise Interrupted()
+        return run_step(*args)
+
+    monkeypatch.setattr(simulation, 'run_step', interrupting_step)
+    return lambda: monkeypatch.setattr(simulation, 'run_step', run_step)
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 2 ** 40])
+def test_varint_round_trip(value):
+    out = bytearray()
+    encode_varint(value, out)
+    assert decode_varint(out, 0) == (value, len(out))
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / 'events.avel')
+    records = [(1, 2, []), (3, 0, [[4, 1], [], [7]]), (9, 9, [[0, 2, 5]])]
+    with EventLogWriter(path, 10, buffer_size=4) as log:
+        for rand_i, rand_j, rounds in records:
+            log.record(rand_i, rand_j, rounds)
+    read = [(rand_i, rand_j, rounds) for step, rand_i, rand_j, rounds in EventLogReader(path)]
+    assert read == [(1, 2, []), (3, 0, [[1, 4], [], [7]]), (9, 9, [[0, 2, 5]])]
+
+
+def test_event_log_matches_timeline(tmp_path):
+    job = make_job()
+    store_path = str(tmp_path / 'results.sqlite')
+    log_path = str(tmp_path / 'events.avel')
+    run_id = simulation.run_job(job, store_path, progress=False, event_log_path=log_path)
+    with ResultsStore(store_path) as store:
+        timeline = store.load(run_id).astype(np.int64)
+
+    log = EventLogReader(log_path)
+    assert log.size == job['size']
+    sizes = log.cascade_sizes()
+    assert len(sizes) == STEPS
+    np.testing.assert_array_equal(sizes, timeline.sum(axis=1))
+    np.testing.assert_array_equal(np.diag(log.co_default_matrix()), log.default_frequency())
+
+
+@pytest.mark.parametrize('first_log', ['none', 'deleted'])
+def test_resume_with_incomplete_log_restarts(first_log, tmp_path, monkeypatch):
+    job = make_job()
+    store_path = str(tmp_path / 'results.sqlite')
+    reference_log = str(tmp_path / 'reference.avel')
+    simulation.run_job(job, store_path, progress=False, event_log_path=reference_log)
+
+    log_path = str(tmp_path / 'events.avel')
+    checkpoint = Checkpointer(str(tmp_path / 'job.npz'), INTERVAL)
+    restore = interrupt_after(monkeypatch, 2 * INTERVAL + 10)
+    with pytest.raises(Interrupted):
+        simulation.run_job(job, store_path, checkpoint, progress=False,
+                           event_log_path=log_path if first_log == 'deleted' else None)
+    restore()
+    if first_log == 'deleted':
+        os.remove(log_path)
+
+    # The checkpoint cannot be continued with a complete log, so the job starts over
+    simulation.run_job(job, store_path, checkpoint, progress=False, event_log_path=log_path)
+    assert read_bytes(log_path) == read_bytes(reference_log)
+
+
+def test_simulate_and_store_rejects_shifted_log(tmp_path):
+    job = make_job()
+    mat = simulation.generate_network(job)
+    with pytest.raises(ValueError):
+        simulation.simulate_and_store(job, mat, INTERVAL, None, str(tmp_path / 'results.sqlite'),
+                                      progress=False, event_log_path=str(tmp_path / 'events.avel'),
+                                      event_log_offset=None)
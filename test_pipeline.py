@@ -0,0 +1,85 @@
+"""Checks that pipelined runs match simulation.run_job and that failed pipelines stop cleanly.
+
+make_connections is replaced by a seeded random matrix so the tests do not need cvxpy. The
+stubs only reach the worker processes when they are forked.
+
+Run with 'python -m pytest test_pipeline.py'."""
+
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import pipeline
+import shared_network
+import simulation
+from results_store import ResultsStore
+
+STEPS = 300
+INTERVAL = 50
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                                reason='the stubs only reach forked workers')
+
+
+@pytest.fixture(autouse=True)
+def stub_connections(monkeypatch):
+    monkeypatch.setattr(simulation, 'make_connections',
+                        lambda connectivity: np.random.random_sample((len(connectivity), len(connectivity))))
+
+
+def make_job(seed):
+    return {'kind': 'frequency', 'network': 'TestNetwork',
+            'cash': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}},
+            'leverage': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40}},
+            'size': 10, 'steps': STEPS, 'seed': seed, 'run': seed}
+
+
+def checkpoint_paths(jobs, directory):
+    return {simulation.job_key(job): str(directory / 'job_{0}.npz'.format(job['seed'])) for job in jobs}
+
+
+def test_pipelined_matches_run_job(tmp_path):
+    jobs = [make_job(seed) for seed in range(3)]
+    reference_store = str(tmp_path / 'reference.sqlite')
+    expected = {}
+    for job in jobs:
+        run_id = simulation.run_job(job, reference_store, progress=False)
+        with ResultsStore(reference_store) as store:
+            expected[job['seed']] = store.load(run_id)
+
+    store_path = str(tmp_path / 'pipelined.sqlite')
+    paths = checkpoint_paths(jobs, tmp_path)
+    pipeline.run_pipelined(jobs, paths, store_path, generators=1, simulators=2, checkpoint_interval=INTERVAL)
+
+    with ResultsStore(store_path) as store:
+        runs = store.load_all(kind='frequency')
+    assert sorted(meta['seed'] for meta, counts in runs) == sorted(expected)
+    for meta, counts in runs:
+        np.testing.assert_array_equal(counts, expected[meta['seed']])
+    assert not any(os.path.exists(path) for path in paths.values())
+
+
+def test_dead_worker_fails_outstanding_jobs(tmp_path, monkeypatch):
+    simulate_and_store = pipeline.simulate_and_store
+
+    def dying(job, *args, **kwargs):
+        if job['seed'] == 1:
+            os._exit(137)  # as if killed for running out of memory
+        return simulate_and_store(job, *args, **kwargs)
+
+    # Publish into memory-mapped files under tmp_path so that leftover networks can be seen
+    spool = tmp_path / 'spool'
+    spool.mkdir()
+    publish = shared_network.SharedNetwork.publish.__func__
+    monkeypatch.setattr(shared_network, 'spool_dir', lambda: str(spool))
+    monkeypatch.setattr(shared_network.SharedNetwork, 'publish',
+                        classmethod(lambda cls, mat: publish(cls, mat, backend='mmap')))
+    monkeypatch.setattr(pipeline, 'simulate_and_store', dying)
+    monkeypatch.setattr(pipeline, 'POLL_INTERVAL', 0.2)
+    jobs = [make_job(seed) for seed in range(6)]
+    with pytest.raises(RuntimeError, match='exit code 137'):
+        pipeline.run_pipelined(jobs, checkpoint_paths(jobs, tmp_path), str(tmp_path / 'results.sqlite'),
+                               generators=1, simulators=1, queue_size=2, checkpoint_interval=None)
+    assert os.listdir(str(spool)) == []
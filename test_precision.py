@@ -0,0 +1,82 @@
+"""Checks the precision policies of precision.py and the fixed-point path of the networks.
+
+make_connections is replaced by a seeded random matrix so the tests do not need cvxpy.
+
+Run with 'python -m pytest test_precision.py'."""
+
+import numpy as np
+import pytest
+
+import contagion
+import precision
+import simulation
+
+STEPS = 300
+
+
+@pytest.fixture(autouse=True)
+def stub_connections(monkeypatch):
+    monkeypatch.setattr(simulation, 'make_connections',
+                        lambda connectivity: np.random.random_sample((len(connectivity), len(connectivity))))
+
+
+def make_job(policy='float64'):
+    return {'kind': 'frequency', 'network': 'TestNetwork',
+            'cash': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}},
+            'leverage': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40}},
+            'size': 10, 'steps': STEPS, 'seed': 5, 'run': 0, 'precision': policy}
+
+
+def test_cents_conversion():
+    mat = np.array([[1.234, 0.005], [10.0, 0.0]])
+    cents = precision.apply_policy(mat, 'cents')
+    assert cents.dtype == np.int64
+    np.testing.assert_array_equal(cents, [[123, 0], [1000, 0]])
+    np.testing.assert_allclose(precision.to_currency(cents, 'cents'), [[1.23, 0], [10, 0]])
+    assert precision.initial_cap('cents') == 100 * precision.initial_cap('float64')
+
+
+def test_scale_amount_truncates_fixed_point():
+    assert contagion.scale_amount(np.int64(1999), 0.5) == 999
+    assert isinstance(contagion.scale_amount(np.int64(1999), 0.5), np.int64)
+    assert contagion.scale_amount(np.float64(1999), 0.5) == 999.5
+
+
+@pytest.mark.parametrize('policy', sorted(precision.POLICIES))
+def test_generated_network_uses_policy(policy):
+    mat = simulation.generate_network(make_job(policy))
+    assert mat.dtype == precision.policy_dtype(policy)
+    reference = simulation.generate_network(make_job('float64'))
+    np.testing.assert_allclose(precision.to_currency(mat, policy), reference, rtol=1e-6, atol=0.01)
+
+
+def test_cents_network_stays_integer():
+    mat = simulation.generate_network(make_job('cents'))
+    np.random.seed(0)
+    for _ in range(50):
+        model = contagion.TestNetwork(10, mat, initial_cap=precision.initial_cap('cents'))
+        model.reset_net()
+        model.step()
+    assert mat.dtype == np.int64
+
+
+def test_validate_reports_drift():
+    mat = simulation.generate_network(make_job('float64'))
+    report = precision.validate(mat, steps=STEPS, seed=1, policies=('float64', 'float32', 'cents'))
+    assert set(report) == {'float64', 'float32', 'cents'}
+    # float64 against itself does not drift
+    assert report['float64']['step_mismatch'] == 0
+    assert report['float64']['total_variation'] == 0
+    for policy, drift in report.items():
+        assert 0 <= drift['step_mismatch'] <= 1
+        assert 0 <= drift['ks'] <= 1
+        assert drift['nbytes'] == np.dtype(precision.policy_dtype(policy)).itemsize * mat.size
+
+
+def test_drift_of_known_sizes():
+    reference = np.array([0, 0, 1, 2])
+    candidate = np.array([0, 1, 1, 2])
+    drift = precision.drift(reference, candidate)
+    assert drift['step_mismatch'] == 0.25
+    assert drift['total_variation'] == pytest.approx(0.25)
+    assert drift['mean_shift'] == pytest.approx(0.25)
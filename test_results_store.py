@@ -0,0 +1,60 @@
+"""Checks the SQLite results store and the labels its runs are indexed by.
+
+Run with 'python -m pytest test_results_store.py'."""
+
+import json
+
+import numpy as np
+import pytest
+
+from distributions import label, parse_label, parse_result_name
+from results_store import ResultsStore, decode_array, encode_array, import_result_files
+
+BETA = {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}}
+
+
+@pytest.mark.parametrize('arr', [np.array([5, 0, 300, 70000]), np.zeros((4, 2), dtype=np.uint16),
+                                 np.array([0.5, 1.25])])
+def test_encode_round_trip(arr):
+    blob, dtype, shape = encode_array(arr)
+    np.testing.assert_array_equal(decode_array(blob, dtype, shape), arr)
+
+
+def test_label_round_trip():
+    cash = label(BETA, 'cash')
+    assert cash == 'BetaCash_Alpha2Beta8Scale40000_'
+    assert parse_label(cash) == ('beta', BETA['params'])
+    # The label does not depend on the order of the params dict
+    assert label({'family': 'beta', 'params': {'Scale': 40000, 'Beta': 8, 'Alpha': 2}}, 'cash') == cash
+
+
+def test_parse_result_name():
+    name = 'TestNetworkresult_BetaCash_Alpha2Beta8Scale40000_BetaLeverage_Alpha2Beta8Scale40_19_10_17_120000.json'
+    assert parse_result_name(name) == ('TestNetwork', 'BetaCash_Alpha2Beta8Scale40000_',
+                                       'BetaLeverage_Alpha2Beta8Scale40_')
+    assert parse_result_name('result_1.json') == ('', '', '')
+    assert parse_result_name('notes.txt') is None
+
+
+def test_store_queries(tmp_path):
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        first = store.add_run('frequency', np.array([3, 2, 1]), 'TestNetwork', label(BETA, 'cash'),
+                              'BetaLeverage_Alpha2Beta8Scale40_', size=100, seed=0, steps=6)
+        second = store.add_run('frequency', np.array([1, 1]), 'TestNetwork', 'BetaCash_Alpha3Beta8Scale40000_',
+                               'BetaLeverage_Alpha2Beta8Scale40_', size=50, seed=1, steps=2, precision='float32')
+        assert [run['id'] for run in store.find(cash_params={'Alpha': 2})] == [first]
+        assert [run['id'] for run in store.find(size=50)] == [second]
+        assert [run['id'] for run in store.find(precision='float32')] == [second]
+        assert not store.exists(seed=0, size=50)
+        np.testing.assert_array_equal(store.load(first), [3, 2, 1])
+        store.delete(first)
+        assert [run['id'] for run in store.find()] == [second]
+
+
+def test_import_result_files(tmp_path):
+    path = tmp_path / 'TestNetworkresult_BetaCash_Alpha2Beta8Scale40000_BetaLeverage_Alpha2Beta8Scale40_1.json'
+    path.write_text(json.dumps({'0': 7, '3': 2}))
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        run_id, = import_result_files(store, [str(path)])
+        np.testing.assert_array_equal(store.load(run_id), [7, 0, 0, 2])
+        assert store.find()[0]['steps'] == 9
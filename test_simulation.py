@@ -0,0 +1,72 @@
+"""Checks that a run resumed from its checkpoint gives the same results as an uninterrupted run.
+
+make_connections is replaced by a seeded random matrix so the tests do not need cvxpy.
+
+Run with 'python -m pytest test_simulation.py'."""
+
+import numpy as np
+import pytest
+
+import simulation
+from checkpoint import Checkpointer
+from results_store import ResultsStore
+
+STEPS = 300
+INTERVAL = 50
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def stub_connections(monkeypatch):
+    monkeypatch.setattr(simulation, 'make_connections',
+                        lambda connectivity: np.random.random_sample((len(connectivity), len(connectivity))))
+
+
+def make_job(kind='timeline', seed=3, run=0):
+    return {'kind': kind, 'network': 'TestNetwork',
+            'cash': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40000}},
+            'leverage': {'family': 'beta', 'params': {'Alpha': 2, 'Beta': 8, 'Scale': 40}},
+            'size': 10, 'steps': STEPS, 'seed': seed, 'run': run}
+
+
+def load_result(store_path, run_id):
+    with ResultsStore(store_path) as store:
+        return store.load(run_id)
+
+
+def read_bytes(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+@pytest.mark.parametrize('kind', ['frequency', 'timeline'])
+def test_resume_matches_uninterrupted_run(kind, tmp_path, monkeypatch):
+    job = make_job(kind)
+    store_path = str(tmp_path / 'results.sqlite')
+    reference_log = str(tmp_path / 'reference.avel')
+    reference = simulation.run_job(job, store_path, progress=False, event_log_path=reference_log)
+
+    # Interrupt between two checkpoints, so the steps after the last one have to be redone
+    run_step = simulation.run_step
+    calls = [0]
+
+    def interrupting_step(*args):
+        calls[0] += 1
+        if calls[0] > 2 * INTERVAL + INTERVAL // 2:
+            raise Interrupted()
+        return run_step(*args)
+
+    checkpoint = Checkpointer(str(tmp_path / 'job.npz'), INTERVAL)
+    resumed_log = str(tmp_path / 'resumed.avel')
+    monkeypatch.setattr(simulation, 'run_step', interrupting_step)
+    with pytest.raises(Interrupted):
+        simulation.run_job(job, store_path, checkpoint, progress=False, event_log_path=resumed_log)
+    monkeypatch.setattr(simulation, 'run_step', run_step)
+    assert checkpoint.load()['step'] == 2 * INTERVAL
+
+    resumed = simulation.run_job(job, store_path, checkpoint, progress=False, event_log_path=resumed_log)
+    np.testing.assert_array_equal(load_result(store_path, resumed), load_result(store_path, reference))
+    assert read_bytes(resumed_log) == read_bytes(reference_log)
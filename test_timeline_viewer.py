@@ -0,0 +1,63 @@
+"""Checks the downsampled views of timeline_viewer.TimelineViewer against the raw timeline.
+
+Run with 'python -m pytest test_timeline_viewer.py'."""
+
+import numpy as np
+import pytest
+
+from timeline_viewer import METHODS, TimelineViewer
+
+STEPS = 300000
+SPIKE = 99990
+
+
+@pytest.fixture
+def timeline(tmp_path):
+    data = np.random.RandomState(0).randint(0, 3, size=(STEPS, 2)).astype(np.uint16)
+    data[SPIKE, 1] = 500
+    path = str(tmp_path / 'timeline.npy')
+    np.save(path, data)
+    return path, data.astype(np.int64).sum(axis=1)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_window_stays_inside_its_range(timeline, method):
+    path, total = timeline
+    viewer = TimelineViewer(path)
+    x, y = viewer.window(100000, 200000, 500, method)
+    assert len(x) <= 500
+    assert x.min() >= 100000 and x.max() < 200000
+    # The spike just before the window must not leak into it
+    if method == 'mean':
+        assert y.max() < 3
+    else:
+        assert y.max() == total[100000:200000].max()
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_full_view_keeps_spike(timeline, method):
+    path, total = timeline
+    x, y = TimelineViewer(path).window(0, None, 2000, method)
+    assert len(x) <= 2000
+    if method != 'mean':
+        assert y.max() == total[SPIKE]
+    if method == 'lttb':
+        assert x[np.argmax(y)] == SPIKE
+
+
+def test_mean_matches_raw_buckets(timeline):
+    path, total = timeline
+    start, stop = 12345, 250001
+    x, y = TimelineViewer(path).window(start, stop, 300, 'mean')
+    edges = np.append(x, stop)
+    expected = [total[lo:hi].mean() for lo, hi in zip(edges[:-1], edges[1:])]
+    np.testing.assert_allclose(y, expected)
+
+
+def test_cached_pyramid_is_reused(timeline):
+    path, total = timeline
+    built = TimelineViewer(path)
+    cached = TimelineViewer(path)
+    for level, cached_level in zip(built.levels, cached.levels):
+        for arr, cached_arr in zip(level[1:], cached_level[1:]):
+            np.testing.assert_array_equal(arr, cached_arr)
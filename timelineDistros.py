@@ -1,12 +1,14 @@
-"""This script will run the avalanche model and save the number of defaults in a CSV with columns for Ratio Defaults, Cascade Defaults
-and rows representing the step. From that, we can plot the timeline of defaults."""
+"""This script will run the avalanche model and save the number of defaults in the results store (see results_store.py)
+as an array with columns for Ratio Defaults, Cascade Defaults and rows representing the step. From that, we can plot
+the timeline of defaults.
+
+To run a grid of configurations use sweep.py with "kind": "timeline" instead of editing the variables below."""
 
 import json
-from tqdm import tqdm
 import numpy as np
-import cvxpy as cvx
-import time
-from contagion import binarize_probabilities, distribute_liabilities, make_connections, DeterministicRatioNetwork, TestNetwork
+from checkpoint import Checkpointer
+from results_store import ResultsStore
+from simulation import is_done, run_job
 
 # adjust numberOfRuns to change number of times entire model is run
 # default = 1
@@ -15,6 +17,18 @@ numberOfRuns = 100
 # default = 1000000
 steps = 1000000
 
+# SQLite file the results are added to
+resultsStore = 'results.sqlite'
+
+# seed of the first run, run j uses seed + j. None draws a random seed for the first run.
+# the seed is stored with the results so any run can be reproduced.
+seed = None
+
+# the state of the running simulation is saved to checkpointPath every checkpointInterval steps.
+# restarting the script resumes from the checkpoint. None disables checkpointing.
+checkpointPath = 'timeline.checkpoint.npz'
+checkpointInterval = 50000
+
 # change distribution:
 # options:
 # normal     - Change distribution variable to 'normal'
@@ -81,147 +95,59 @@ poissonCashLambda = 3;  # default = 3
   # leverage #
 poissonLeverageLambda = 3;  # default = 3
 
-# The below function is called to run the model
-def runModel(cashDistribution, leverageDistribution):
-    cash_vector = generateCashVector(cashDistribution)
-    cash_vector[cash_vector <= 0] = 1 * 10 ** -10
-    # cash_vector[cash_vector > 5000] = 6500
-    cash_to_connectivity = lambda x: safe_ln(x)
-    connectivity_vector = cash_to_connectivity(cash_vector)
-
-    # Make the adjacency matrix
-    mat = make_connections(connectivity_vector)
-    mat = binarize_probabilities(mat)
-
-    # Distribute liabilities
-    leverage_ratios = generateLeverageRatios(leverageDistribution)
-    leverage_ratios[leverage_ratios < 5] = 5
-
-    liabilities = np.multiply(cash_vector, leverage_ratios)
-    mat = distribute_liabilities(mat, liabilities)
-    for i, cash in enumerate(cash_vector):
-        mat[i, i] = cash
-    defaults = np.zeros((steps, 2))
-    for z in tqdm(range(steps)):
-        model = TestNetwork(100, mat)
-        model.reset_net()
-
-        results = model.step()
-        defaults[z, 0] = results['ratio_defaults']
-        defaults[z, 1] = results['cascade_defaults']
-
-
-    """ the below code saves the results in a .csv file with the date and time added to
-    the name so as to prevent overwriting. The format parameter can be used
-    to change the variable type that is stored in the .csv file, with the result being
-    smaller file sizes when more data efficient variable types are utilized."""
-
-    # use fmt='%1c' to save data as characters
-    # use fmt='%1d' to save data as signed decimal integers
-    # use fmt='%1e' to save data in scientific notation
-    # use fmt='%1f' to save data as decimal floating points
-    # use fmt='%1g' to save data as the most efficient of e or f
-    # use fmt='%1o' to save data as signed octals
-    # use fmt='%1s' to save data as string characters
-    # use fmt='%1u' to save data as unsigned decimal integers
-    # use fmt='%1x' to save data as unsigned hexadecimal integer
-
-    np.savetxt('defaults_' + str(time.strftime("%d_%m_%y_%H%M%S")) + '.csv', defaults, delimiter=',', fmt='%1f')
-
-    """ Cursory analysis reveals that with the standard settings and no fmt parameter used
-    the data files are approximately 50MB in size. Manually formatting in excel can reduce
-    the file size to 5MB.
-    
-    Using signed decimal integers the file size is approximately 4MB
-    Using decimal floating points the file size is approximately 18MB"""
-
-# The below function generates the chosen cash distribution
-def generateCashVector(distribution):
-    if distribution == 'beta':
-        cash_vector = np.random.beta(betaCashAlpha, betaCashBeta, size)
-    elif distribution == 'chisquare':
-        cash_vector = np.random.chisquare(chiCashDf, size)
-    elif distribution == 'f':
-        cash_vector = np.random.gamma(fCashDfnum, fCashDfden, size)
-    elif distribution == 'gamma':
-        cash_vector = np.random.gamma(gammaCashShape, gammaCashScale, size)
-    elif distribution == 'lognormal':
-        cash_vector = np.random.lognormal(lognormalCashMean, lognormalCashSigma, size)
-    elif distribution == 'normal':
-        cash_vector = np.random.normal(normalCashLocation, normalCashScale, size)
-    elif distribution == 'poisson':
-        cash_vector = np.random.poisson(poissonCashLambda, size)
-    else: cash_vector = np.random.normal(normalCashLocation, normalCashScale, size)
-    return cash_vector
-
-# The below function generates a string to reflect the chosen cash distribution
-def generateCashString(distribution):
-    cashString = 'aoeu'
-    if distribution == 'beta':
-        cashString = 'BetaCash_Alpha' + str(betaCashAlpha) + 'Beta' + str(betaCashBeta) + '_'
-    elif distribution == 'chisquare':
-        cashString = 'ChisquareCash_Df' + str(chiCashDf) + '_'
-    elif distribution == 'f':
-        cashString = 'fCash_Dfnum' + str(fCashDfnum) + 'Dfden' + str(fCashDfden) + '_'
-    elif distribution == 'gamma':
-        cashString = 'GammaCash_Shape' + str(gammaCashShape) + 'Scale' + str(gammaCashScale) + '_'
-    elif distribution == 'normal':
-        cashString = 'NormalCash_location' + str(normalCashLocation) + 'Scale' + str(normalCashScale) + '_'
-    elif distribution == 'poisson':
-        cashString = 'PoissonCash_Lambda' + str(poissonCashLambda) + '_'
-    elif distribution == 'lognormal':
-        cashString = 'LognormalCash_Mean' + str(lognormalCashMean) + 'Sigma' + str(lognormalCashSigma) + '_'
-    else: cashString = 'NormalCash_location' + str(normalCashLocation) + 'Scale' + str(normalCashScale) + '_'
-    return cashString
-
-# The below function generates the chosen leverage distribution
-def generateLeverageRatios(distribution):
-    if distribution == 'beta':
-        leverage_ratios = np.random.beta(betaLeverageAlpha, betaLeverageBeta, size)
-    elif distribution == 'chisquare':
-        leverage_ratios = np.random.chisquare(chiLeverageDf, size)
-    elif distribution == 'f':
-        leverage_ratios = np.random.f(fLeverageDfnum, fLeverageDfden, size)
-    elif distribution == 'gamma':
-        leverage_ratios = np.random.gamma(gammaLeverageShape, gammaLeverageScale, size)
-    elif distribution == 'lognormal':
-        leverage_ratios = np.random.lognormal(lognormalLeverageMean, lognormalLeverageSigma, size)
-    elif distribution == 'normal':
-        leverage_ratios = np.random.normal(normalLeverageLocation, normalLeverageScale, size)
-    elif distribution == 'poisson':
-        leverage_ratios = np.random.poisson(poissonLeverageLambda, size)
-    else: leverage_ratios = np.random.normal(normalLeverageLocation, normalLeverageScale, size)
-    return leverage_ratios
-
-# The below function generates a string to reflect the chosen leverage distribution
-def generateLeverageString(distribution):
-    leverageString = 'aoeu'
-    if distribution == 'beta':
-        leverageString = 'BetaLeverage_Alpha' + str(betaLeverageAlpha) + 'Beta' + str(betaLeverageBeta) + '_'
-    elif distribution == 'chisquare':
-        leverageString = 'ChisquareLeverage_Df' + str(chiLeverageDf) + '_'
-    elif distribution == 'f':
-        leverageString = 'fLeverage_Dfnum' + str(fLeverageDfnum) + 'Dfden' + str(fLeverageDfden) + '_'
-    elif distribution == 'gamma':
-        leverageString = 'GammaLeverage_Shape' + str(gammaLeverageShape) + 'Scale' + str(gammaLeverageScale) + '_'
-    elif distribution == 'lognormal':
-        leverageString = 'LognormalLeverage_Mean' + str(lognormalLeverageMean) + 'Sigma' + str(lognormalLeverageSigma) + '_'
-    elif distribution == 'normal':
-        leverageString = 'NormalLeverage_location' + str(normalLeverageLocation) + 'Scale' + str(normalLeverageScale) + '_'
-    elif distribution == 'poisson':
-        leverageString = 'PoissonLeverage_Lambda' + str(poissonLeverageLambda) + '_'
-    else: leverageString = 'NormalLeverage_location' + str(normalLeverageLocation) + 'Scale' + str(normalLeverageScale) + '_'
-    return leverageString
-
-# The below function checks for and corrects potential division by zero
-def safe_ln(x, minval=0.000000000001):
-    return np.log(x.clip(min=minval)).astype(int)
-
-''' Create strings to use in saving results so there is record of distributions
-    used and their parameters: '''
-cashString = generateCashString(cashDistribution)
-leverageString = generateLeverageString(leverageDistribution)
-
-# the below loop runs the program for the desired number of iterations
-for j in range(numberOfRuns):
-    runModel(cashDistribution, leverageDistribution)
+# The below dicts collect the parameters of each distribution in the order they appear in the result labels.
+cashParams = {
+    'beta': {'Alpha': betaCashAlpha, 'Beta': betaCashBeta},
+    'chisquare': {'Df': chiCashDf},
+    'f': {'Dfnum': fCashDfnum, 'Dfden': fCashDfden},
+    'gamma': {'Shape': gammaCashShape, 'Scale': gammaCashScale},
+    'lognormal': {'Mean': lognormalCashMean, 'Sigma': lognormalCashSigma},
+    'normal': {'location': normalCashLocation, 'Scale': normalCashScale},
+    'poisson': {'Lambda': poissonCashLambda},
+}
+leverageParams = {
+    'beta': {'Alpha': betaLeverageAlpha, 'Beta': betaLeverageBeta},
+    'chisquare': {'Df': chiLeverageDf},
+    'f': {'Dfnum': fLeverageDfnum, 'Dfden': fLeverageDfden},
+    'gamma': {'Shape': gammaLeverageShape, 'Scale': gammaLeverageScale},
+    'lognormal': {'Mean': lognormalLeverageMean, 'Sigma': lognormalLeverageSigma},
+    'normal': {'location': normalLeverageLocation, 'Scale': normalLeverageScale},
+    'poisson': {'Lambda': poissonLeverageLambda},
+}
+
+# The below function describes run j of the model, see simulation.py
+def makeJob(runSeed, run):
+    return {'kind': 'timeline', 'network': 'TestNetwork',
+            'cash': {'family': cashDistribution, 'params': cashParams[cashDistribution]},
+            'leverage': {'family': leverageDistribution, 'params': leverageParams[leverageDistribution]},
+            'size': size, 'steps': steps, 'seed': runSeed, 'run': run}
+
+
+# the below loop runs the program for the desired number of iterations.
+# the timelines, distribution configuration and seed are saved in the results store as
+# compressed unsigned integers, which is far smaller than the CSV files previously written per run.
+checkpoint = Checkpointer(checkpointPath, checkpointInterval)
+state = checkpoint.load()
+firstRun = state['run'] if state is not None else 0
+# the seed of the first run is kept in the checkpoints, so a restart gives every run the seed it had
+if state is None:
+    firstSeed = seed if seed is not None else np.random.randint(2 ** 31 - 1)
+    checkpoint.save(run=0, firstSeed=firstSeed)
+elif 'job' in state:
+    firstSeed = json.loads(state['job'])['seed'] - firstRun
+else:
+    firstSeed = state['firstSeed']
+for j in range(firstRun, numberOfRuns):
+    stored = False
+    if j == firstRun and state is not None and 'job' in state:
+        job = json.loads(state['job'])  # resume the interrupted run
+        if job != makeJob(job['seed'], job['run']):
+            raise ValueError('checkpoint ' + checkpoint.path + ' was written with a different configuration')
+        with ResultsStore(resultsStore) as store:
+            stored = is_done(store, job)  # the process died after storing the run
+    else:
+        job = makeJob(firstSeed + j, j)
+    if not stored:
+        run_job(job, resultsStore, checkpoint)
+    checkpoint.save(run=j + 1, firstSeed=firstSeed)
+checkpoint.remove()
@@ -0,0 +1,311 @@
+"""Downsampled views of long default timelines.
+
+Parsing a million-step CSV with np.loadtxt and plotting every point is slow. This module keeps
+the timeline in a .npy file that is memory-mapped instead of parsed, and builds a pyramid of
+per-bucket min/max/sum once. A window of any width is then served from the coarsest pyramid
+level that still has enough resolution, so the work per view depends on the number of points
+drawn, not on the number of steps.
+
+    viewer = TimelineViewer(convert_csv('defaults_0.csv'))
+    x, y = viewer.window(0, viewer.steps, max_points=2000)            # min/max envelope
+    x, y = viewer.window(250000, 260000, 2000, method='lttb')
+
+The timeline has one row per step and a column per default count (Ratio Defaults, Cascade
+Defaults). The viewer adds their sum as a last series, which is the default series shown."""
+
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+METHODS = ['minmax', 'mean', 'lttb']
+
+# Bumped when the cached pyramid layout changes, so older caches are rebuilt
+PYRAMID_VERSION = 2
+# Arrays of every pyramid level, after its bucket size
+LEVEL_ARRAYS = ('min', 'max', 'sum', 'min_at', 'max_at')
+
+
+def convert_csv(csv_path, npy_path=None, chunk_rows=1 << 18):
+    """Converts a timeline CSV written by the old timelineDistros.py into a .npy file.
+
+    The CSV is read in chunks, so memory use does not grow with the number of steps.
+
+    Args:
+        csv_path (str): CSV with one row per step.
+        npy_path (str): Destination, defaults to the CSV path with a .npy extension.
+        chunk_rows (int): Rows parsed at a time.
+
+    Returns:
+        The path of the .npy file.
+    """
+    if npy_path is None:
+        npy_path = os.path.splitext(csv_path)[0] + '.npy'
+    with open(csv_path) as fp:
+        rows = sum(1 for line in fp if line.strip())
+        fp.seek(0)
+        columns = len(fp.readline().split(','))
+        fp.seek(0)
+        out = open_memmap(npy_path, mode='w+', dtype=np.uint16, shape=(rows, columns))
+        start = 0
+        while start < rows:
+            lines = []
+            for line in fp:
+                if line.strip():
+                    lines.append(line)
+                    if len(lines) == chunk_rows:
+                        break
+            chunk = np.loadtxt(lines, delimiter=',', ndmin=2)
+            out[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        out.flush()
+        del out
+    return npy_path
+
+
+def export_timeline(store_path, run_id, npy_path):
+    """Writes a timeline from the results store to a .npy file the viewer can memory-map."""
+    from results_store import ResultsStore
+    with ResultsStore(store_path) as store:
+        np.save(npy_path, store.load(run_id))
+    return npy_path
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the points that preserve the visual shape of a series, including isolated spikes
+    that averaging would flatten.
+
+    Args:
+        x (numpy array): Increasing x values.
+        y (numpy array): Values.
+        n_out (int): Number of points to keep, at least 3.
+
+    Returns:
+        An (x, y) tuple of the kept points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.zeros(n_out, dtype=np.int64)
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # Average of the next bucket, or the last point for the final bucket
+        next_lo, next_hi = hi, edges[k + 2] if k + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[k + 1] = a
+    keep[-1] = n - 1
+    return x[keep], y[keep]
+
+
+def _merge(mins, maxs, sums, min_at, max_at):
+    """Merges the buckets along axis 1 of (groups, buckets, series) arrays."""
+    groups = np.arange(mins.shape[0])[:, None]
+    series = np.arange(mins.shape[2])[None, :]
+    lo = mins.argmin(axis=1)
+    hi = maxs.argmax(axis=1)
+    return (mins[groups, lo, series], maxs[groups, hi, series], sums.sum(axis=1),
+            min_at[groups, lo, series], max_at[groups, hi, series])
+
+
+def _reduce(mins, maxs, sums, min_at, max_at, factor):
+    """Merges every `factor` consecutive buckets, the last group may be partial.
+
+    min_at and max_at hold the step of each bucket's min and max, and follow them through the merge.
+    """
+    arrays = (mins, maxs, sums, min_at, max_at)
+    n = len(mins)
+    full = n // factor * factor
+    parts = []
+    if full:
+        shape = (full // factor, factor) + mins.shape[1:]
+        parts.append(_merge(*[arr[:full].reshape(shape) for arr in arrays]))
+    if full < n:
+        parts.append(_merge(*[arr[full:][None] for arr in arrays]))
+    return tuple(np.concatenate(merged) for merged in zip(*parts))
+
+
+class TimelineViewer:
+    """Serves downsampled windows of a memory-mapped timeline.
+
+    Args:
+        path (str): .npy file with one row per step.
+        base (int): Steps per bucket of the finest pyramid level.
+        factor (int): Buckets merged into one between consecutive levels.
+        cache (bool): Save the pyramid next to the timeline and reuse it while the timeline
+            is unchanged.
+    """
+
+    def __init__(self, path, base=64, factor=8, cache=True):
+        self.path = path
+        self.base = base
+        self.factor = factor
+        data = np.load(path, mmap_mode='r')
+        self.data = data.reshape(len(data), -1)
+        self.steps = len(self.data)
+        self.n_series = self.data.shape[1] + 1 if self.data.shape[1] > 1 else 1
+        self.levels = self._load_pyramid() if cache else None
+        if self.levels is None:
+            self.levels = self._build_pyramid()
+            if cache:
+                self._save_pyramid()
+
+    @property
+    def _pyramid_path(self):
+        return self.path + '.pyramid.npz'
+
+    def _source_stamp(self):
+        stat = os.stat(self.path)
+        return np.array([PYRAMID_VERSION, stat.st_size, stat.st_mtime, self.base, self.factor], dtype=float)
+
+    def _series(self, start, stop):
+        """Raw rows of the window as int64, with the total as last column."""
+        rows = np.asarray(self.data[start:stop], dtype=np.int64)
+        if self.n_series > 1:
+            rows = np.column_stack((rows, rows.sum(axis=1)))
+        return rows
+
+    def _steps(self, start, rows):
+        """Step number of every entry of `rows`, which start at step `start`."""
+        return np.arange(start, start + len(rows))[:, None].repeat(rows.shape[1], axis=1)
+
+    def _build_pyramid(self):
+        # The finest level is built from the memory map in chunks so the timeline is never fully loaded
+        chunk = self.base * (1 << 14)
+        parts = []
+        for start in range(0, self.steps, chunk):
+            rows = self._series(start, min(start + chunk, self.steps))
+            at = self._steps(start, rows)
+            parts.append(_reduce(rows, rows, rows, at, at, self.base))
+        if not parts:
+            return []
+        levels = [(self.base,) + tuple(np.concatenate(arrays) for arrays in zip(*parts))]
+        while len(levels[-1][1]) > 1:
+            levels.append((levels[-1][0] * self.factor,) + _reduce(*(levels[-1][1:] + (self.factor,))))
+        return levels
+
+    def _save_pyramid(self):
+        arrays = {'stamp': self._source_stamp()}
+        for k, level in enumerate(self.levels):
+            for name, arr in zip(LEVEL_ARRAYS, level[1:]):
+                arrays['{0}_{1}'.format(name, k)] = arr
+        np.savez(self._pyramid_path, **arrays)
+
+    def _load_pyramid(self):
+        if not os.path.exists(self._pyramid_path):
+            return None
+        with np.load(self._pyramid_path) as cached:
+            if not np.array_equal(cached['stamp'], self._source_stamp()):
+                return None
+            levels = []
+            size = self.base
+            while 'min_{0}'.format(len(levels)) in cached.files:
+                k = len(levels)
+                levels.append((size,) + tuple(cached['{0}_{1}'.format(name, k)] for name in LEVEL_ARRAYS))
+                size *= self.factor
+        return levels
+
+    def _raw_buckets(self, start, stop, size=1):
+        """The raw rows of [start, stop) in buckets of `size` steps.
+
+        Returns (mins, maxs, sums, min_at, max_at, starts, counts) as _buckets merges them.
+        """
+        rows = self._series(start, stop)
+        at = self._steps(start, rows)
+        starts = np.arange(start, stop, size)
+        return _reduce(rows, rows, rows, at, at, size) + (starts, np.minimum(starts + size, stop) - starts)
+
+    def _buckets(self, start, stop, n_buckets):
+        """Min, max and sum of the window in at most `n_buckets` buckets.
+
+        Reads the pyramid buckets that lie entirely inside the window from the coarsest level
+        that still has more buckets than requested, and the partial buckets at either edge
+        from the raw timeline, so nothing outside [start, stop) is included. Returns
+        (x, min, max, mean, min_at, max_at) with x the first step of each bucket and min_at,
+        max_at the steps of its min and max.
+        """
+        bucket = (stop - start) // n_buckets
+        source = None
+        for level in self.levels:
+            if level[0] <= bucket:
+                source = level
+        if source is None:
+            pieces = [self._raw_buckets(start, stop)]
+        else:
+            size = source[0]
+            # The last bucket of a level is cut short by the end of the timeline
+            lo, hi = -(-start // size), len(source[1]) if stop == self.steps else stop // size
+            head_stop = min(lo * size, stop)
+            tail_start = max(hi * size, head_stop)
+            pieces = []
+            if start < head_stop:
+                pieces.append(self._raw_buckets(start, head_stop, head_stop - start))
+            if lo < hi:
+                starts = np.arange(lo, hi) * size
+                counts = np.minimum(starts + size, self.steps) - starts
+                pieces.append(tuple(arr[lo:hi] for arr in source[1:]) + (starts, counts))
+            if tail_start < stop:
+                pieces.append(self._raw_buckets(tail_start, stop, stop - tail_start))
+        mins, maxs, sums, min_at, max_at, starts, counts = [np.concatenate(arrays) for arrays in zip(*pieces)]
+
+        # Round the group up so the window never has more than n_buckets buckets
+        group = -(-len(mins) // n_buckets)
+        mins, maxs, sums, min_at, max_at = _reduce(mins, maxs, sums, min_at, max_at, group)
+        counts = np.add.reduceat(counts, np.arange(0, len(counts), group))
+        return starts[::group], mins, maxs, sums / counts[:, None].astype(float), min_at, max_at
+
+    def window(self, start=0, stop=None, max_points=2000, method='minmax', series=-1):
+        """Returns a downsampled view of steps [start, stop).
+
+        Args:
+            start (int): First step.
+            stop (int): End of the window, defaults to the last step.
+            max_points (int): Maximum number of points returned.
+            method (str): 'minmax' for an envelope with each bucket's min and max (spikes are
+                never lost), 'mean' for bucket averages, or 'lttb' for
+                Largest-Triangle-Three-Buckets on the extremes of a finer bucketing.
+            series (int): Column of the timeline, -1 (the default) for the total defaults.
+
+        Returns:
+            An (x, y) tuple of numpy arrays, x being step numbers.
+        """
+        if method not in METHODS:
+            raise ValueError('unknown method: ' + str(method))
+        stop = self.steps if stop is None else min(stop, self.steps)
+        start = max(start, 0)
+        if stop <= start:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        if stop - start <= max_points:
+            return np.arange(start, stop), self._series(start, stop)[:, series]
+
+        if method == 'minmax':
+            x, mins, maxs, means, min_at, max_at = self._buckets(start, stop, max(max_points // 2, 1))
+            return np.repeat(x, 2), np.column_stack((mins[:, series], maxs[:, series])).ravel()
+        elif method == 'mean':
+            x, mins, maxs, means, min_at, max_at = self._buckets(start, stop, max_points)
+            return x, means[:, series]
+        else:
+            # Feed LTTB about eight times more points than it returns: the raw rows of small
+            # windows, else the min and max of every bucket at the steps they occur, so spikes survive
+            if stop - start <= 8 * max_points:
+                x, y = np.arange(start, stop), self._series(start, stop)[:, series]
+            else:
+                x, mins, maxs, means, min_at, max_at = self._buckets(start, stop, 4 * max_points)
+                at = np.column_stack((min_at[:, series], max_at[:, series]))
+                values = np.column_stack((mins[:, series], maxs[:, series]))
+                order = at.argsort(axis=1)
+                rows = np.arange(len(at))[:, None]
+                x, y = at[rows, order].ravel(), values[rows, order].ravel()
+                # Flat buckets have their min and max at the same step
+                keep = np.concatenate(([True], np.diff(x) > 0))
+                x, y = x[keep], y[keep]
+            return lttb(x, y, max_points)